@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Statistiques par question et par cours calculées sur le journal des réponses (NumPy).
+
+    python answer_analytics.py --db reponses.sqlite3
+    python answer_analytics.py --benchmark 2000000
+
+Le journal (voir answer_log) est lu par blocs en colonnes NumPy, et chaque
+bloc met à jour des agrégats en quelques passes vectorisées (bincount) :
+nombre de réponses, d'erreurs, répartition des choix, histogramme des temps
+de réponse, explications servies par le cache. `AnswerAnalytics.refresh` ne
+lit que les lignes ajoutées depuis la dernière fois : le coût d'un
+rafraîchissement ne dépend pas de la taille de l'historique.
+
+Le temps médian est lu sur un histogramme à pas logarithmique (TIME_BINS
+classes de 0,25 s à 1 h) : précision d'environ 15 %, largement suffisante
+ici, et agrégable sans garder les temps un par un.
+
+L'application s'en sert pour :
+- `difficulty` : taux d'erreur lissé vers la moyenne générale (une question
+  répondue deux fois n'est pas « impossible »), pour tirer plus souvent les
+  questions difficiles ;
+- `choice_counts` : mauvaises réponses les plus choisies, à pré-charger.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+TIME_MIN = 0.25
+TIME_MAX = 3600.0
+TIME_BINS = 64
+_TIME_EDGES = np.geomspace(TIME_MIN, TIME_MAX, TIME_BINS - 1)
+
+
+class Aggregates:
+    """Agrégats par clé entière (0..n-1), agrandis au besoin."""
+
+    def __init__(self):
+        self.answers = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.choices = np.zeros((0, 1), dtype=np.int64)  # [clé, choix canonique 1-based]
+        self.times = np.zeros((0, TIME_BINS), dtype=np.int32)
+        self.explained = np.zeros(0, dtype=np.int64)  # réponses avec une explication IA
+        self.cache_hits = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.answers)
+
+    def _grow(self, n_keys, n_choices):
+        old, old_choices = len(self), self.choices.shape[1]
+        if n_keys <= old and n_choices <= old_choices:
+            return
+        n_keys, n_choices = max(n_keys, old), max(n_choices, old_choices)
+        for name in ("answers", "errors", "explained", "cache_hits"):
+            grown = np.zeros(n_keys, dtype=np.int64)
+            grown[:old] = getattr(self, name)
+            setattr(self, name, grown)
+        choices = np.zeros((n_keys, n_choices), dtype=np.int64)
+        choices[:old, :old_choices] = self.choices
+        self.choices = choices
+        times = np.zeros((n_keys, TIME_BINS), dtype=np.int32)
+        times[:old] = self.times
+        self.times = times
+
+    def update(self, keys, choice, correct, answer_time, cache_hit):
+        """
+        Ajoute des réponses (tableaux de même longueur) : answer_time vaut NaN
+        s'il est inconnu, cache_hit -1 sans explication, 0 ou 1 sinon.
+        """
+        if not len(keys):
+            return
+        n_keys = int(keys.max()) + 1
+        n_choices = max(int(choice.max()) + 1, 1)
+        self._grow(n_keys, n_choices)
+        n_keys = len(self)
+        self.answers += np.bincount(keys, minlength=n_keys)
+        self.errors += np.bincount(keys, weights=~correct, minlength=n_keys).astype(np.int64)
+
+        width = self.choices.shape[1]
+        self.choices += np.bincount(keys * width + choice, minlength=n_keys * width).reshape(n_keys, width)
+
+        timed = ~np.isnan(answer_time)
+        bins = np.searchsorted(_TIME_EDGES, answer_time[timed])
+        self.times += np.bincount(
+            keys[timed] * TIME_BINS + bins, minlength=n_keys * TIME_BINS
+        ).reshape(n_keys, TIME_BINS).astype(np.int32)
+
+        explained = cache_hit >= 0
+        self.explained += np.bincount(keys[explained], minlength=n_keys)
+        self.cache_hits += np.bincount(keys[cache_hit == 1], minlength=n_keys)
+
+    def error_rate(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.errors / self.answers
+
+    def cache_hit_rate(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.cache_hits / self.explained
+
+    def median_time(self):
+        """Temps de réponse médian (s) de chaque clé, NaN sans temps connu."""
+        cumulated = np.cumsum(self.times, axis=1)
+        totals = cumulated[:, -1]
+        first = np.argmax(cumulated * 2 >= totals[:, None], axis=1)
+        # Centre géométrique de la classe (les classes extrêmes sont ouvertes)
+        edges = np.concatenate(([TIME_MIN / 1.15], _TIME_EDGES, [TIME_MAX * 1.15]))
+        centers = np.sqrt(edges[:-1] * edges[1:])
+        return np.where(totals > 0, centers[first], np.nan)
+
+
+class AnswerAnalytics:
+    """
+    Agrégats du journal `path`, par question (identifiant canonique) et par cours,
+    relus au plus toutes les `check_interval` secondes.
+    """
+
+    def __init__(self, path, check_interval=10.0, prior_weight=5.0, chunk_size=200_000, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.prior_weight = prior_weight
+        self.chunk_size = chunk_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self.last_id = 0
+        self.events = 0
+        self.question_ids = []  # clé -> identifiant de question
+        self._keys = {}  # identifiant de question -> clé
+        self.courses = []
+        self._course_keys = {}
+        self.by_question = Aggregates()
+        self.by_course = Aggregates()
+
+    def _due(self, now):
+        return self._checked_at is None or now - self._checked_at >= self.check_interval
+
+    def refresh(self, force=False, wait=True):
+        """
+        Intègre les réponses ajoutées au journal depuis le dernier appel ; renvoie leur
+        nombre. Avec wait=False, la lecture se fait dans un thread (sans effet si une
+        lecture est déjà en cours) et les agrégats actuels restent utilisables.
+        """
+        now = self._clock()
+        if not (force or self._due(now)) or not self._lock.acquire(blocking=wait):
+            return 0
+        if not wait:
+            threading.Thread(
+                target=self._refresh_locked, args=(now, force), name="statistiques-reponses", daemon=True
+            ).start()
+            return 0
+        return self._refresh_locked(now, force)
+
+    def _refresh_locked(self, now, force):
+        try:
+            if not (force or self._due(now)):
+                return 0
+            self._checked_at = now
+            return self._read_new_rows()
+        except sqlite3.Error:
+            # Journal verrouillé ou illisible : nouvel essai au prochain rafraîchissement
+            return 0
+        finally:
+            self._lock.release()
+
+    def _read_new_rows(self):
+        if not os.path.exists(self.path):
+            return 0
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+        added = 0
+        try:
+            (last_id,) = conn.execute("SELECT IFNULL(MAX(id), 0) FROM answers").fetchone()
+            # Les petits entiers sont regroupés en une valeur par ligne : le coût de
+            # la lecture est surtout la création des objets Python, colonne par colonne
+            cursor = conn.execute(
+                "SELECT question_id, "
+                "choice | (correct << 8) | ((IFNULL(cache_hit, -1) + 1) << 9) | (course << 11), "
+                "answer_time FROM answers WHERE id > ? AND id <= ?",
+                (self.last_id, last_id),
+            )
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                qids, packed, answer_time = zip(*rows)
+                self._add(qids, packed, answer_time)
+                added += len(rows)
+            self.last_id = last_id
+        finally:
+            conn.close()
+        self.events += added
+        return added
+
+    def _add(self, qids, packed, answer_time):
+        keys = self._keys
+        question_keys = np.fromiter(
+            (keys[q] if q in keys else keys.setdefault(q, len(keys)) for q in qids),
+            dtype=np.int64,
+            count=len(qids),
+        )
+        self.question_ids.extend(list(keys)[len(self.question_ids):])
+
+        packed = np.asarray(packed, dtype=np.int64)
+        # Peu de cours : correspondance numéro -> clé sur les valeurs distinctes du bloc
+        course_numbers, inverse = np.unique(packed >> 11, return_inverse=True)
+        course_keys = np.array(
+            [self._course_keys.setdefault(int(c), len(self._course_keys)) for c in course_numbers],
+            dtype=np.int64,
+        )[inverse]
+        self.courses.extend(list(self._course_keys)[len(self.courses):])
+        columns = (
+            packed & 0xFF,
+            (packed >> 8 & 1).astype(bool),
+            np.asarray(answer_time, dtype=np.float64),  # None -> NaN
+            (packed >> 9 & 3) - 1,
+        )
+        self.by_question.update(question_keys, *columns)
+        self.by_course.update(course_keys, *columns)
+
+    def difficulty(self, question_ids):
+        """
+        Taux d'erreur lissé de chaque question : (erreurs + p x m) / (réponses + p),
+        m étant le taux d'erreur général et p = prior_weight. Une question jamais
+        répondue vaut m.
+        """
+        # Lecture sans verrou pendant un rafraîchissement : les nouvelles clés
+        # peuvent précéder l'agrandissement des tableaux, elles comptent comme inconnues
+        answers, errors = self.by_question.answers, self.by_question.errors
+        total = answers.sum()
+        mean = errors.sum() / total if total else 0.5
+        keys = np.fromiter((self._keys.get(q, -1) for q in question_ids), dtype=np.int64)
+        known = (keys >= 0) & (keys < min(len(answers), len(errors)))
+        result = np.full(len(keys), mean)
+        k = keys[known]
+        result[known] = (errors[k] + self.prior_weight * mean) / (answers[k] + self.prior_weight)
+        return result
+
+    def choice_counts(self, question_id):
+        """{choix canonique: nombre de fois choisi} pour une question (vide si jamais répondue)."""
+        key = self._keys.get(question_id)
+        choices = self.by_question.choices
+        if key is None or key >= len(choices):
+            return {}
+        row = choices[key]
+        return {int(c): int(row[c]) for c in np.flatnonzero(row)}
+
+    def course_table(self):
+        """Une ligne par cours : réponses, taux d'erreur, temps médian, cache touché."""
+        with self._lock:
+            return self._course_table()
+
+    def _course_table(self):
+        stats = self.by_course
+        order = np.argsort(self.courses) if self.courses else []
+        error_rate, median, hit_rate = stats.error_rate(), stats.median_time(), stats.cache_hit_rate()
+        return [
+            {
+                "cours": self.courses[i],
+                "réponses": int(stats.answers[i]),
+                "taux d'erreur": round(float(error_rate[i]), 3),
+                "temps médian (s)": None if np.isnan(median[i]) else round(float(median[i]), 1),
+                "explications en cache": None if np.isnan(hit_rate[i]) else round(float(hit_rate[i]), 3),
+            }
+            for i in order
+        ]
+
+    def hardest_questions(self, n=10, min_answers=5):
+        """Identifiants et taux d'erreur des `n` questions les plus ratées (assez répondues)."""
+        with self._lock:
+            return self._hardest_questions(n, min_answers)
+
+    def _hardest_questions(self, n, min_answers):
+        stats = self.by_question
+        rate = np.where(stats.answers >= min_answers, stats.error_rate(), -1.0)
+        best = np.argsort(-rate, kind="stable")[:n]
+        return [(self.question_ids[i], float(rate[i])) for i in best if rate[i] >= 0]
+
+
+# ================== BENCHMARK ==================
+def write_synthetic_log(path, n_events, n_questions=30_000, n_courses=8, seed=0):
+    """Journal synthétique de `n_events` réponses (questions plus ou moins difficiles)."""
+    from answer_log import _SCHEMA
+
+    rng = np.random.default_rng(seed)
+    hardness = rng.beta(2, 5, n_questions)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.execute("BEGIN")
+        for start in range(0, n_events, 200_000):
+            n = min(200_000, n_events - start)
+            q = rng.integers(0, n_questions, n)
+            correct = rng.random(n) >= hardness[q]
+            choice = np.where(correct, 1, rng.integers(2, 5, n))
+            answer_time = rng.lognormal(2.5, 0.6, n)
+            cache_hit = rng.integers(-1, 2, n)
+            conn.executemany(
+                "INSERT INTO answers (timestamp, session, question_id, course, choice, correct, "
+                "answer_time, explanation_latency, cache_hit, mode) VALUES (0, 's', ?, ?, ?, ?, ?, NULL, ?, NULL)",
+                zip(
+                    (f"{i:032x}" for i in q.tolist()),
+                    (q % n_courses + 1).tolist(),
+                    choice.tolist(),
+                    correct.tolist(),
+                    answer_time.tolist(),
+                    (None if h < 0 else h for h in cache_hit.tolist()),
+                ),
+            )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def benchmark(n_events):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reponses.sqlite3")
+        write_synthetic_log(path, n_events)
+        analytics = AnswerAnalytics(path)
+
+        start = time.perf_counter()
+        analytics.refresh(force=True)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        table = analytics.course_table()
+        analytics.difficulty(analytics.question_ids)
+        analytics.by_question.median_time()
+        stats_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analytics.refresh(force=True)
+        refresh_time = time.perf_counter() - start
+
+    print(f"Chargement de {analytics.events:,} réponses : {load_time:.2f} s "
+          f"({analytics.events / load_time:,.0f} réponses/s)")
+    print(f"Statistiques de {len(analytics.question_ids):,} questions : {stats_time * 1000:.0f} ms")
+    print(f"Rafraîchissement sans nouvelle réponse : {refresh_time * 1000:.1f} ms")
+    print(table[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistiques du journal des réponses du quiz.")
+    parser.add_argument(
+        "--db",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "reponses.sqlite3"),
+        help="journal des réponses (SQLite)",
+    )
+    parser.add_argument("--hardest", type=int, default=10, help="nombre de questions les plus ratées à afficher")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="mesure le débit sur N réponses synthétiques")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+
+    analytics = AnswerAnalytics(args.db)
+    analytics.refresh(force=True)
+    print(f"{analytics.events} réponses, {len(analytics.question_ids)} questions")
+    for row in analytics.course_table():
+        print("  " + ", ".join(f"{k} : {v}" for k, v in row.items()))
+    for qid, rate in analytics.hardest_questions(args.hardest):
+        print(f"  {qid} : {rate:.0%} d'erreurs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Journal des réponses des élèves (SQLite), écrit en tâche de fond.
+
+Chaque validation produit un `AnswerEvent` : question (identifiant canonique),
+choix (index canonique, voir question_identity), juste ou non, temps de
+réponse, latence de l'explication IA et cache touché ou non. Ces données
+serviront aux statistiques par question (difficulté, distracteurs...).
+
+Écriture différée (write-behind) : `append` ne fait que mettre l'événement
+dans une file en mémoire, un thread l'écrit ensuite par lots (une transaction
+par lot), toutes les `flush_interval` secondes ou dès que `batch_size`
+événements attendent. Le clic « Valider » ne paie donc jamais l'écriture.
+- mémoire bornée : au-delà de `max_pending` événements en attente (disque
+  lent, base verrouillée), les nouveaux sont abandonnés et comptés ;
+- arrêt propre : `close()`, appelé aussi à la sortie du processus (atexit),
+  écrit ce qui reste dans la file.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    session TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    course INTEGER NOT NULL,
+    choice INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    answer_time REAL,
+    explanation_latency REAL,
+    cache_hit INTEGER,
+    mode TEXT
+);
+"""
+
+
+class AnswerEvent(NamedTuple):
+    timestamp: float
+    session: str
+    question_id: str
+    course: int
+    choice: int  # index canonique (1-based) du choix de l'élève
+    correct: bool
+    answer_time: Optional[float]  # s entre l'affichage de la question et la validation
+    explanation_latency: Optional[float] = None  # s ; None sans explication
+    cache_hit: Optional[bool] = None  # explication trouvée en cache (mémoire ou store)
+    mode: Optional[str] = None  # mode d'explication de la session
+
+
+class AnswerLog:
+    """File d'événements écrite dans `path` par un thread dédié."""
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0, max_pending=10_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pending = deque()
+        self._writing = 0  # événements retirés de la file, pas encore écrits
+        self._cond = threading.Condition()
+        self._closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name="journal-reponses", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, event):
+        """Met l'événement en file ; renvoie False s'il est abandonné (file pleine ou journal fermé)."""
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(event)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def flush(self, timeout=None):
+        """Attend que tous les événements en file soient écrits ; renvoie False si le délai expire."""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout=10.0):
+        """Écrit les événements restants et arrête le thread (idempotent)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "écrits": self.written,
+                "en attente": len(self._pending),
+                "abandonnés": self.dropped,
+                "erreurs d'écriture": self.errors,
+            }
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._closed or len(self._pending) >= self.batch_size,
+                        self.flush_interval,
+                    )
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                    self._writing = len(batch)
+                    if not batch and self._closed:
+                        return
+                ok = self._write(conn, batch) if batch else True
+                with self._cond:
+                    self._writing = 0
+                    if ok:
+                        self.written += len(batch)
+                    elif self._closed:
+                        # Arrêt et base toujours inaccessible : on n'insiste pas
+                        self.dropped += len(batch) + len(self._pending)
+                        self._pending.clear()
+                    else:
+                        # Nouvel essai au prochain tour, sans dépasser la borne mémoire
+                        room = max(0, self.max_pending - len(self._pending))
+                        self.dropped += len(batch) - min(room, len(batch))
+                        self._pending.extendleft(reversed(batch[:room]))
+                    self._cond.notify_all()
+                if not ok:
+                    time.sleep(self.flush_interval)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO answers (timestamp, session, question_id, course, choice, correct, "
+                    "answer_time, explanation_latency, cache_hit, mode) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error:
+            with self._cond:
+                self.errors += 1
+            return False
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Explications groupées pour le mode « en fin de quiz ».
+
+Les réponses à expliquer sont envoyées à Groq en une seule requête (ou en
+quelques requêtes si la liste dépasse `max_items` / `max_chars`), qui renvoie
+un objet JSON {"1": "explication", "2": "...", ...}.
+
+Chaque élément est un dict avec les mêmes champs que get_ai_explanation :
+question_text, choices, user_index, correct_index (index 1-based d'origine).
+"""
+import json
+
+from question_identity import canonicalize
+
+
+# Partie statique du prompt, identique pour tous les lots (préfixe mis en cache
+# par le fournisseur) ; seules les questions sont envoyées dans `build_prompt`
+INSTRUCTIONS = """Tu es un professeur qui explique simplement l'électronique et les semi-conducteurs \
+à des élèves de l'ENSEA. On te donne des questions de quiz numérotées (### n), avec leurs \
+choix numérotés, le numéro choisi par l'élève et celui de la bonne réponse.
+Pour chaque question :
+1. Explique en quelques phrases pourquoi la bonne réponse est correcte.
+2. Si la réponse de l'élève est fausse, explique en quoi sa réponse est trompeuse.
+3. Reste concis et pédagogique, en français.
+4. Désigne les réponses par leur texte, pas par leur numéro.
+Réponds uniquement avec un objet JSON {"1": "explication", "2": "...", ...},
+une entrée par question, numérotée comme les questions."""
+
+
+def _item_block(number, item):
+    canon = canonicalize(item["question_text"], item["choices"])
+    numbered = "\n".join(f"{i + 1}. {c}" for i, c in enumerate(canon.choices))
+    return (
+        f"### {number}\nQuestion : {canon.text}\nChoix :\n{numbered}\n"
+        f"Réponse de l'élève : {canon.to_canonical(item['user_index'])}\n"
+        f"Bonne réponse : {canon.to_canonical(item['correct_index'])}\n"
+    )
+
+
+def build_prompt(items):
+    """Partie variable du prompt : les questions du lot."""
+    return "\n".join(_item_block(n, item) for n, item in enumerate(items, 1))
+
+
+def chunk(items, max_items=15, max_chars=12_000):
+    """Découpe la liste en lots qui tiennent dans une requête."""
+    batch, size = [], 0
+    for n, item in enumerate(items, 1):
+        block_size = len(_item_block(n, item))
+        if batch and (len(batch) >= max_items or size + block_size > max_chars):
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += block_size
+    if batch:
+        yield batch
+
+
+def parse_payload(raw, n_items):
+    """
+    Lit la réponse JSON du modèle. Renvoie une liste de `n_items` explications,
+    None pour celles qui manquent. Lève ValueError si le JSON est illisible.
+    """
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"réponse JSON invalide : {exc}") from None
+    if not isinstance(data, dict):
+        raise ValueError("la réponse JSON n'est pas un objet")
+
+    explanations = []
+    for n in range(1, n_items + 1):
+        text = data.get(str(n))
+        explanations.append(text.strip() if isinstance(text, str) and text.strip() else None)
+    return explanations
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Explications « toutes les réponses » : un seul appel Groq par question.
+
+Au lieu de demander une explication par couple (réponse élève, bonne réponse),
+on demande une fois par question un objet JSON :
+
+    {"correct": "pourquoi la bonne réponse est juste",
+     "distractors": {"2": "pourquoi le choix 2 est trompeur", ...}}
+
+(numéros des choix dans l'ordre canonique, voir `question_identity`).
+L'explication montrée à l'élève est ensuite composée localement.
+"""
+import json
+
+
+# Partie statique du prompt, identique pour toutes les questions (préfixe mis en
+# cache par le fournisseur) ; seule la question est envoyée dans `build_prompt`
+INSTRUCTIONS = """Tu es un professeur qui explique simplement l'électronique et les semi-conducteurs \
+à des élèves de l'ENSEA. On te donne une question de quiz, ses choix numérotés et le numéro \
+de la bonne réponse.
+Réponds uniquement avec un objet JSON de la forme
+{"correct": "...", "distractors": {"numéro": "...", ...}} :
+- "correct" : en quelques phrases, pourquoi la bonne réponse est correcte ;
+- "distractors" : une entrée pour chaque autre choix, numérotée comme dans la question,
+  qui explique en une ou deux phrases en quoi ce choix est trompeur.
+Reste concis et pédagogique, en français. Dans les textes, désigne les réponses par leur
+texte, pas par leur numéro."""
+
+
+def build_prompt(question_text, choices, correct_index):
+    """Partie variable du prompt : la question, ses choix et le numéro de la bonne réponse."""
+    numbered = "\n".join(f"{i + 1}. {c}" for i, c in enumerate(choices))
+    return f"Question : {question_text}\nChoix :\n{numbered}\nBonne réponse : {correct_index}"
+
+
+def parse_payload(raw, n_choices, correct_index):
+    """
+    Valide la réponse JSON du modèle. Renvoie {"correct": str, "distractors": {int: str}}
+    ou lève ValueError si elle est inutilisable.
+    """
+    raw = raw.strip()
+    if raw.startswith("```"):
+        # Bloc de code markdown autour du JSON
+        raw = raw.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"réponse JSON invalide : {exc}") from None
+    if not isinstance(data, dict):
+        raise ValueError("la réponse JSON n'est pas un objet")
+
+    correct = data.get("correct")
+    if not isinstance(correct, str) or not correct.strip():
+        raise ValueError("champ 'correct' manquant")
+
+    distractors = data.get("distractors")
+    if not isinstance(distractors, dict):
+        raise ValueError("champ 'distractors' manquant")
+    rebuttals = {}
+    for number, text in distractors.items():
+        try:
+            index = int(number)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= n_choices and index != correct_index and isinstance(text, str) and text.strip():
+            rebuttals[index] = text.strip()
+    missing = [i for i in range(1, n_choices + 1) if i != correct_index and i not in rebuttals]
+    if missing:
+        raise ValueError(f"réfutation manquante pour le(s) choix {missing}")
+
+    return {"correct": correct.strip(), "distractors": rebuttals}
+
+
+def dumps(payload):
+    """Sérialise un payload validé pour le cache / le store."""
+    return json.dumps(
+        {"correct": payload["correct"], "distractors": {str(k): v for k, v in payload["distractors"].items()}},
+        ensure_ascii=False,
+    )
+
+
+def loads(text):
+    """Inverse de `dumps`."""
+    data = json.loads(text)
+    return {"correct": data["correct"], "distractors": {int(k): v for k, v in data["distractors"].items()}}
+
+
+def compose(payload, choices, user_index, correct_index):
+    """Explication pour un élève ayant choisi `user_index` (index canoniques 1-based)."""
+    if user_index == correct_index:
+        return payload["correct"]
+    return (
+        f"{payload['correct']}\n\n"
+        f"Pourquoi ta réponse « {choices[user_index - 1]} » est trompeuse : {payload['distractors'][user_index]}"
+    )
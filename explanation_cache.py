@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Cache mémoire des explications IA, partagé par toutes les sessions
+du processus Streamlit.
+
+- éviction LRU au-delà de `maxsize` entrées ;
+- expiration au bout de `ttl` secondes ;
+- single-flight : si plusieurs sessions demandent la même clé en même temps,
+  un seul appel Groq est fait, les autres attendent son résultat. Un demandeur
+  plus urgent n'attend pas un calcul moins prioritaire (pré-chargement) : il
+  lance le sien, que rejoignent ensuite les autres demandeurs.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from question_identity import canonicalize
+
+
+def make_key(question_text, choices, user_index, correct_index):
+    """
+    Clé d'une explication (index 1-based comme dans le quiz), commune au cache
+    et au store. Elle est calculée sur la forme canonique de la question :
+    toutes les permutations des choix partagent la même clé.
+    """
+    canon = canonicalize(question_text, choices)
+    return f"{canon.id}:{canon.to_canonical(user_index)}:{canon.to_canonical(correct_index)}"
+
+
+def make_question_key(question_text, choices, correct_index):
+    """Clé des explications « toutes les réponses » d'une question (voir choice_explanations)."""
+    canon = canonicalize(question_text, choices)
+    return f"{canon.id}:*:{canon.to_canonical(correct_index)}"
+
+
+class _Flight:
+    """Calcul en cours pour une clé : les autres demandeurs attendent dessus."""
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ExplanationCache:
+    """Cache LRU + TTL thread-safe avec coalescence des calculs concurrents."""
+
+    def __init__(self, maxsize=2048, ttl=7 * 24 * 3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (expiration, valeur)
+        self._flights = {}  # clé -> _Flight en cours
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_locked(self, key, value):
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Renvoie la valeur en cache, ou None si absente / expirée."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key, value):
+        if not value:
+            return
+        with self._lock:
+            self._put_locked(key, value)
+
+    def get_or_compute(self, key, compute, priority=0):
+        """
+        Renvoie la valeur en cache, sinon appelle `compute()` une seule fois
+        pour tous les demandeurs concurrents de la même clé. `priority` (plus
+        petit = plus urgent) : un calcul en cours moins urgent n'est pas attendu.
+        Une exception de `compute()` est propagée à tous et n'est pas mise en cache,
+        pas plus qu'une valeur vide.
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None or priority < flight.priority
+            if leader:
+                flight = self._flights[key] = _Flight(priority)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and flight.value:
+                    self._put_locked(key, flight.value)
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage persistant des explications IA (SQLite en mode WAL).
+
+Les explications survivent aux redémarrages / redéploiements du serveur
+Streamlit : on ne repaie pas Groq pour toute la banque après un crash.
+
+- clé = identifiant canonique de la question + réponse élève + bonne réponse
+  (voir `explanation_cache.make_key`) ;
+- taille plafonnée à `max_entries`, les plus anciennes entrées sont évincées ;
+- `prune()` supprime les explications des questions modifiées ou retirées
+  de la banque (leur identifiant, calculé sur le contenu, a changé) ;
+- le fichier peut être partagé par plusieurs processus Streamlit de la même
+  machine : la table `leases` et `get_or_compute` (voir shared_cache) font
+  qu'un seul d'entre eux appelle Groq pour une clé donnée.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from shared_cache import SingleFlightStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS explanations (
+    key TEXT PRIMARY KEY,
+    question_id TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS explanations_question ON explanations (question_id);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class ExplanationStore(SingleFlightStore):
+    """Store clé -> explication, une connexion SQLite par thread."""
+
+    def __init__(self, path, max_entries=50_000, lease_ttl=None, wait_timeout=None):
+        self.path = path
+        self.max_entries = max_entries
+        if lease_ttl is not None:
+            self.lease_ttl = lease_ttl
+        if wait_timeout is not None:
+            self.wait_timeout = wait_timeout
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None : autocommit, les transactions sont explicites
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Renvoie l'explication stockée, ou None."""
+        row = self._connection().execute(
+            "SELECT explanation FROM explanations WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, keys):
+        """Renvoie {clé: explication} pour les clés présentes."""
+        keys = list(keys)
+        found = {}
+        conn = self._connection()
+        # SQLite limite le nombre de paramètres par requête
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(conn.execute(
+                f"SELECT key, explanation FROM explanations WHERE key IN ({marks})", chunk
+            ).fetchall())
+        return found
+
+    def put(self, key, question_id, explanation):
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO explanations (key, question_id, explanation, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, question_id, explanation, time.time()),
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def checkpoint(self):
+        """Reporte le journal WAL dans le fichier principal, seul à copier ou à committer."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM explanations").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            # rowid croissant = ordre d'insertion : on retire les plus anciennes
+            conn.execute(
+                "DELETE FROM explanations WHERE rowid IN "
+                "(SELECT rowid FROM explanations ORDER BY rowid LIMIT ?)",
+                (excess,),
+            )
+
+    def acquire_lease(self, key):
+        """
+        Prend le bail de génération de `key` pour `lease_ttl` secondes ; renvoie
+        son jeton, ou None si un autre processus le détient déjà. BEGIN IMMEDIATE
+        verrouille le fichier : la vérification et la prise sont atomiques entre
+        processus. Les échéances sont en heure murale, commune aux processus.
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                taken = conn.execute(
+                    "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if not taken:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO leases (key, token, expires_at) VALUES (?, ?, ?)",
+                        (key, token, now + self.lease_ttl),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return None if taken else token
+
+    def release_lease(self, key, token):
+        with self._write_lock:
+            self._connection().execute(
+                "DELETE FROM leases WHERE key = ? AND token = ?", (key, token)
+            )
+
+    def leased(self, key):
+        """Vrai si un processus génère actuellement l'explication de `key`."""
+        row = self._connection().execute(
+            "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def invalidate(self, question_id):
+        """Supprime toutes les explications d'une question."""
+        with self._write_lock:
+            self._connection().execute(
+                "DELETE FROM explanations WHERE question_id = ?", (question_id,)
+            )
+
+    def prune(self, valid_question_ids):
+        """
+        Supprime les explications dont la question n'est plus dans la banque
+        (question modifiée = nouvel identifiant). Renvoie le nombre de lignes supprimées.
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS valid_ids (h TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM valid_ids")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO valid_ids (h) VALUES (?)",
+                    ((h,) for h in valid_question_ids),
+                )
+                deleted = conn.execute(
+                    "DELETE FROM explanations WHERE question_id NOT IN (SELECT h FROM valid_ids)"
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def __len__(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM explanations").fetchone()
+        return count
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Ordonnanceur global des appels Groq (un par processus).
+
+Toutes les sessions passent par lui au lieu d'appeler l'API chacune de leur
+côté, ce qui évite les rafales de 429 :
+- seaux à jetons en requêtes/minute et tokens/minute ;
+- nombre maximum de requêtes simultanées ;
+- classes de priorité : explication interactive > pré-chargement > pré-génération ;
+- nouvel essai avec attente exponentielle aléatoire (jitter), en respectant
+  l'en-tête Retry-After ; un 429 met tout le processus en pause ;
+- file d'attente bornée : au-delà, ou après `max_wait` secondes d'attente,
+  `Overloaded` est levée et l'appelant affiche un message de repli.
+"""
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+PREFETCH = 1
+BULK = 2
+
+
+class Overloaded(Exception):
+    """File d'attente pleine ou attente trop longue : la demande est abandonnée."""
+
+
+class TokenBucket:
+    """Seau à jetons rechargé de `per_minute` jetons par minute (None = illimité)."""
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0 if per_minute else None
+        self.capacity = capacity or per_minute or 0
+        self._clock = clock
+        self._level = self.capacity
+        self._stamp = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def delay(self, amount):
+        """Secondes à attendre avant de pouvoir prendre `amount` jetons."""
+        if self.rate is None:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self._level >= amount else (amount - self._level) / self.rate
+
+    def take(self, amount):
+        if self.rate is not None:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        """Corrige après coup (consommation réelle - estimée) ; le niveau peut devenir négatif."""
+        if self.rate is not None:
+            self._refill()
+            self._level -= delta
+
+
+def retry_after(exc):
+    """Délai demandé par l'API (en-têtes retry-after-ms / Retry-After), ou None."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time()) if date else None
+
+
+class GroqScheduler:
+    def __init__(
+        self,
+        rpm=None,
+        tpm=None,
+        max_concurrency=8,
+        max_queue=200,
+        max_wait=20.0,
+        max_retries=4,
+        base_backoff=1.0,
+        max_backoff=30.0,
+        is_retryable=lambda exc: False,
+        clock=time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.is_retryable = is_retryable
+        self._clock = clock
+        self._requests = TokenBucket(rpm, clock=clock)
+        self._tokens = TokenBucket(tpm, clock=clock)
+        self._cond = threading.Condition()
+        self._queue = []  # tas de (priorité, numéro d'arrivée)
+        self._seq = itertools.count()
+        self._running = 0
+        self._paused_until = 0.0
+        self.shed = 0
+        self.retries = 0
+
+    def _deadline(self, priority, max_wait):
+        if max_wait is None:
+            # La pré-génération hors ligne peut attendre aussi longtemps qu'il faut
+            max_wait = None if priority == BULK else self.max_wait
+        return None if max_wait is None else self._clock() + max_wait
+
+    def _acquire(self, priority, tokens, deadline):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            if priority != BULK and len(self._queue) >= self.max_queue:
+                self.shed += 1
+                raise Overloaded("file d'attente Groq pleine")
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = self._clock()
+                    wait = None
+                    if self._queue[0] == ticket and self._running < self.max_concurrency:
+                        wait = max(
+                            self._paused_until - now,
+                            self._requests.delay(1),
+                            self._tokens.delay(tokens),
+                        )
+                        if wait <= 0:
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            heapq.heappop(self._queue)
+                            self._running += 1
+                            self._cond.notify_all()
+                            return
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self.shed += 1
+                            raise Overloaded("attente trop longue pour Groq")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, tokens=1, max_wait=None):
+        """Réserve une place (débit + concurrence) pour la durée du bloc, sans nouvel essai."""
+        self._acquire(priority, tokens, self._deadline(priority, max_wait))
+        try:
+            yield
+        finally:
+            self._release()
+
+    def adjust_tokens(self, delta):
+        """Corrige le seau de tokens avec la consommation réelle d'un appel."""
+        with self._cond:
+            self._tokens.adjust(delta)
+
+    def backoff(self, exc, attempt):
+        """Délai avant le prochain essai ; un Retry-After met tout le processus en pause."""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        after = retry_after(exc)
+        if after is not None:
+            delay = max(delay, after)
+            with self._cond:
+                self._paused_until = max(self._paused_until, self._clock() + after)
+        return delay
+
+    def call(self, fn, priority=INTERACTIVE, tokens=1, max_wait=None):
+        """
+        Exécute `fn()` quand le débit et la concurrence le permettent, avec nouveaux
+        essais sur les erreurs `is_retryable`. Lève Overloaded si la demande est abandonnée.
+        """
+        deadline = self._deadline(priority, max_wait)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority, tokens, deadline)
+            try:
+                return fn()
+            except Exception as exc:
+                if attempt == self.max_retries or not self.is_retryable(exc):
+                    raise
+                delay = self.backoff(exc, attempt)
+                if deadline is not None and self._clock() + delay > deadline:
+                    raise
+            finally:
+                self._release()
+            self.retries += 1
+            time.sleep(delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "queued": len(self._queue),
+                "shed": self.shed,
+                "retries": self.retries,
+            }
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Importe des exports Moodle (XML ou GIFT) dans une banque de questions SQLite.
+
+    python import_moodle.py export_cours3.xml cours4.gift --db questions.sqlite3
+    QUIZZ_QUESTION_BANK=questions.sqlite3 streamlit run quizzCompoRFavecIA.py
+
+Les fichiers sont lus au fil de l'eau (iterparse pour le XML, question par
+question pour le GIFT) : la mémoire reste constante quelle que soit la taille
+de l'export. Seules les questions à choix unique (multichoice, vrai/faux) sont
+reprises, au format de l'application {"course", "text", "choices", "answer"} ;
+les autres, et celles qui sont invalides, sont comptées et ignorées. Le cours
+vient de la catégorie Moodle (« Cours 3 ») ou, à défaut, de `--course`.
+Un fichier .json au format de questions.json peut aussi être importé, par
+exemple pour reprendre la banque existante.
+
+    python import_moodle.py --benchmark 5000
+
+mesure le débit d'import sur un export XML synthétique.
+"""
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from typing import NamedTuple
+
+from question_bank import append_questions, validate_question
+
+_TAG = re.compile(r"<[^>]+>")
+_SPACES = re.compile(r"\s+")
+_COURSE = re.compile(r"cours\D{0,3}(\d+)", re.IGNORECASE)
+_GIFT_FORMAT = re.compile(r"^\[(?:html|moodle|plain|markdown)\]")
+_GIFT_TRUE_FALSE = re.compile(r"^(T|TRUE|F|FALSE)\s*(?:#.*)?$", re.DOTALL)
+
+
+class Rejected(NamedTuple):
+    where: str
+    reason: str
+
+
+def _plain_text(text):
+    """Texte Moodle (souvent du HTML) -> texte simple sur une ligne."""
+    text = html.unescape(_TAG.sub(" ", text or ""))
+    return _SPACES.sub(" ", text).strip()
+
+
+def course_from_category(category, default):
+    match = _COURSE.search(category or "")
+    return int(match.group(1)) if match else default
+
+
+# ================== MOODLE XML ==================
+def iter_moodle_xml(source, course=None):
+    """Questions (dicts) et Rejected d'un export Moodle XML, lues une par une."""
+    category = None
+    context = ET.iterparse(source, events=("start", "end"))
+    _, root = next(context)
+    number = 0
+    for event, elem in context:
+        if event != "end" or elem.tag != "question":
+            continue
+        kind = elem.get("type")
+        if kind == "category":
+            category = elem.findtext("category/text")
+        else:
+            number += 1
+            yield _moodle_question(elem, kind, f"question {number}", course_from_category(category, course))
+        # Les questions déjà lues sont libérées : mémoire constante
+        root.clear()
+
+
+def _moodle_question(elem, kind, where, course):
+    if kind not in ("multichoice", "truefalse"):
+        return Rejected(where, f"type {kind} non pris en charge")
+    if kind == "multichoice" and (elem.findtext("single") or "true").strip() == "false":
+        return Rejected(where, "plusieurs réponses possibles")
+
+    choices, correct = [], []
+    for n, answer in enumerate(elem.iterfind("answer"), 1):
+        text = _plain_text(answer.findtext("text"))
+        if kind == "truefalse":
+            text = {"true": "Vrai", "false": "Faux"}.get(text.lower(), text)
+        choices.append(text)
+        try:
+            if float(answer.get("fraction", "0")) >= 100:
+                correct.append(n)
+        except ValueError:
+            pass
+    if len(correct) != 1:
+        return Rejected(where, "il faut exactement une bonne réponse")
+    return {
+        "course": course,
+        "text": _plain_text(elem.findtext("questiontext/text")),
+        "choices": choices,
+        "answer": correct[0],
+    }
+
+
+# ================== GIFT ==================
+def _gift_blocks(lines):
+    """(numéro de ligne, texte) de chaque question ou commande $CATEGORY."""
+    block, start = [], None
+    for number, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if stripped.startswith("//"):
+            continue
+        if not stripped:
+            if block:
+                yield start, "\n".join(block)
+                block = []
+            continue
+        if stripped.startswith("$CATEGORY:"):
+            if block:
+                yield start, "\n".join(block)
+                block = []
+            yield number, stripped
+            continue
+        if not block:
+            start = number
+        block.append(stripped)
+    if block:
+        yield start, "\n".join(block)
+
+
+def _gift_split(text, separators):
+    """Découpe sur les caractères `separators` non échappés ; renvoie [(séparateur, morceau)]."""
+    parts, current, marker, escaped = [], [], "", False
+    for char in text:
+        if escaped:
+            current.append("\\" + char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in separators:
+            parts.append((marker, "".join(current)))
+            marker, current = char, []
+        else:
+            current.append(char)
+    parts.append((marker, "".join(current)))
+    return parts
+
+
+def _gift_unescape(text):
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def iter_gift(lines, course=None):
+    """Questions (dicts) et Rejected d'un fichier GIFT, lues une par une."""
+    category = None
+    for number, block in _gift_blocks(lines):
+        if block.startswith("$CATEGORY:"):
+            category = block[len("$CATEGORY:"):]
+            continue
+        yield _gift_question(block, f"ligne {number}", course_from_category(category, course))
+
+
+def _gift_question(block, where, course):
+    if block.startswith("::"):
+        end = block.find("::", 2)
+        block = block[end + 2:] if end != -1 else block
+    parts = _gift_split(block, "{}")
+    if len(parts) != 3 or [marker for marker, _ in parts] != ["", "{", "}"]:
+        return Rejected(where, "bloc de réponses {...} introuvable")
+    (_, before), (_, answers), (_, after) = parts
+    text = _GIFT_FORMAT.sub("", before.strip())
+    if after.strip():
+        text = f"{text} … {after.strip()}"
+    text = _plain_text(_gift_unescape(text))
+
+    answers = answers.strip()
+    true_false = _GIFT_TRUE_FALSE.match(answers)
+    if true_false:
+        return {
+            "course": course,
+            "text": text,
+            "choices": ["Vrai", "Faux"],
+            "answer": 1 if true_false.group(1).startswith("T") else 2,
+        }
+    if "->" in answers or answers.startswith("#"):
+        return Rejected(where, "type de question non pris en charge")
+
+    choices, correct = [], []
+    for marker, answer in _gift_split(answers, "=~")[1:]:
+        answer = _gift_split(answer, "#")[0][1]  # sans le feedback
+        answer = re.sub(r"^%-?[\d.]+%", "", answer.strip())
+        choices.append(_plain_text(_gift_unescape(answer)))
+        if marker == "=":
+            correct.append(len(choices))
+    if len(correct) != 1:
+        return Rejected(where, "il faut exactement une bonne réponse")
+    return {"course": course, "text": text, "choices": choices, "answer": correct[0]}
+
+
+# ================== IMPORT ==================
+def iter_file(path, course=None):
+    if path.endswith(".xml"):
+        yield from iter_moodle_xml(path, course)
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig") as f:
+            yield from iter_gift(f, course)
+
+
+class ImportReport:
+    def __init__(self):
+        self.read = 0
+        self.added = 0
+        self.n_rejected = 0
+        self.rejected = []  # les premiers seulement, pour le message d'erreur
+
+    @property
+    def duplicates(self):
+        return self.read - self.n_rejected - self.added
+
+
+def import_files(paths, db, course=None, batch_size=1000, max_reported=20):
+    """Importe les fichiers dans la banque SQLite `db` ; renvoie un ImportReport."""
+    report = ImportReport()
+
+    def valid_questions():
+        for path in paths:
+            for item in iter_file(path, course):
+                report.read += 1
+                if not isinstance(item, Rejected):
+                    try:
+                        yield validate_question(item)
+                        continue
+                    except ValueError as exc:
+                        item = Rejected(f"question {report.read}", str(exc))
+                report.n_rejected += 1
+                if len(report.rejected) < max_reported:
+                    report.rejected.append(Rejected(f"{os.path.basename(path)}, {item.where}", item.reason))
+
+    report.added = append_questions(db, valid_questions(), batch_size)
+    return report
+
+
+# ================== BENCHMARK ==================
+def write_synthetic_export(path, n_questions, n_courses=8):
+    """Export Moodle XML synthétique : questions à 4 choix et vrai/faux, une catégorie par cours."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n')
+        per_course = -(-n_questions // n_courses)
+        for n in range(n_questions):
+            if n % per_course == 0:
+                f.write(
+                    '<question type="category"><category><text>'
+                    f"$course$/top/Cours {n // per_course + 1}</text></category></question>\n"
+                )
+            text = (
+                f"<p>Question {n} : dans un semi-conducteur dopé, la grandeur n°{n} "
+                "dépend-elle de la température et de la concentration en impuretés ?</p>"
+            )
+            if n % 4 == 3:
+                answers = [("true", 100), ("false", 0)]
+                kind = "truefalse"
+            else:
+                answers = [(f"<p>Proposition {k} pour la question {n}</p>", 100 if k == n % 4 else 0)
+                           for k in range(4)]
+                kind = "multichoice"
+            f.write(
+                f'<question type="{kind}"><name><text>Q{n}</text></name>'
+                f'<questiontext format="html"><text><![CDATA[{text}]]></text></questiontext>'
+                "<single>true</single>"
+            )
+            for answer, fraction in answers:
+                f.write(f'<answer fraction="{fraction}" format="html"><text><![CDATA[{answer}]]></text>'
+                        "<feedback><text></text></feedback></answer>")
+            f.write("</question>\n")
+        f.write("</quiz>\n")
+
+
+def benchmark(n_questions):
+    with tempfile.TemporaryDirectory() as directory:
+        export = os.path.join(directory, "export.xml")
+        db = os.path.join(directory, "questions.sqlite3")
+        write_synthetic_export(export, n_questions)
+        size = os.path.getsize(export) / 1e6
+
+        start = time.perf_counter()
+        parsed = sum(1 for item in iter_moodle_xml(export) if not isinstance(item, Rejected))
+        parse_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = import_files([export], db)
+        import_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        again = import_files([export], db)
+        dedupe_time = time.perf_counter() - start
+
+    print(f"Export synthétique : {n_questions} questions, {size:.1f} Mo")
+    print(f"Lecture seule : {parsed / parse_time:,.0f} questions/s ({size / parse_time:.1f} Mo/s)")
+    print(f"Import complet : {report.added} ajoutées en {import_time:.2f} s "
+          f"({report.added / import_time:,.0f} questions/s)")
+    print(f"Ré-import : {again.duplicates} doublons ignorés en {dedupe_time:.2f} s")
+    try:
+        import resource
+    except ImportError:
+        return
+    print(f"Mémoire max du processus : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Importe des exports Moodle (XML, GIFT) dans une banque de questions SQLite."
+    )
+    parser.add_argument("files", nargs="*", help="fichiers .xml (Moodle), .gift/.txt (GIFT) ou .json")
+    parser.add_argument(
+        "--db",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.sqlite3"),
+        help="banque SQLite à compléter (créée au besoin)",
+    )
+    parser.add_argument("--course", type=int, help="cours des questions sans catégorie « Cours N »")
+    parser.add_argument("--batch-size", type=int, default=1000, help="questions par transaction")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="mesure le débit sur N questions synthétiques")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+    if not args.files:
+        parser.error("indique au moins un fichier à importer")
+
+    report = import_files(args.files, args.db, args.course, args.batch_size)
+    print(
+        f"{report.read} questions lues : {report.added} ajoutées, "
+        f"{report.duplicates} déjà présentes, {report.n_rejected} ignorées."
+    )
+    for rejected in report.rejected:
+        print(f"  {rejected.where} : {rejected.reason}", file=sys.stderr)
+    if report.n_rejected > len(report.rejected):
+        print(f"  ... et {report.n_rejected - len(report.rejected)} autres.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Routage des requêtes d'explication entre plusieurs modèles Groq.
+
+Les questions « faciles » à expliquer (Vrai/Faux, élève qui a juste avec un
+prompt court) partent vers le modèle le plus rapide ; les autres vers le
+modèle standard, sauf si ses statistiques en direct (p95 de latence au-delà
+du SLO, taux d'erreur trop élevé) le rendent moins intéressant qu'un autre.
+Chaque route fixe aussi son `max_output_tokens`.
+"""
+import threading
+from collections import deque
+from typing import NamedTuple
+
+from question_identity import normalize_text
+from resilience import LatencyTracker
+
+_TRUE_FALSE = {"vrai", "faux"}
+
+
+class Route(NamedTuple):
+    name: str
+    model: str
+    max_output_tokens: int
+
+
+class QuestionFeatures(NamedTuple):
+    true_false: bool
+    n_choices: int
+    prompt_chars: int
+    correct: bool
+
+
+def question_features(choices, user_index, correct_index, prompt):
+    return QuestionFeatures(
+        true_false={normalize_text(c) for c in choices} == _TRUE_FALSE,
+        n_choices=len(choices),
+        prompt_chars=len(prompt),
+        correct=user_index == correct_index,
+    )
+
+
+class _ModelStats:
+    def __init__(self, window):
+        self.latencies = LatencyTracker(window)
+        self.outcomes = deque(maxlen=window)  # True = succès
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelRouter:
+    """
+    `routes` : {nom: (modèle, max_output_tokens)} ; doit contenir `fast` et `default`.
+    Un modèle est « en forme » si son p95 reste sous `latency_slo` secondes et son
+    taux d'erreur sous `max_error_rate` (sans mesure, il est présumé en forme).
+    """
+
+    def __init__(
+        self,
+        routes,
+        fast="rapide",
+        default="standard",
+        latency_slo=3.0,
+        max_error_rate=0.2,
+        short_prompt_chars=600,
+        window=100,
+    ):
+        self.routes = {name: Route(name, model, tokens) for name, (model, tokens) in routes.items()}
+        self.fast = fast
+        self.default = default
+        self.latency_slo = latency_slo
+        self.max_error_rate = max_error_rate
+        self.short_prompt_chars = short_prompt_chars
+        self._lock = threading.Lock()
+        self._window = window
+        self._stats = {}
+
+    def _model_stats(self, model):
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = _ModelStats(self._window)
+            return stats
+
+    def record(self, model, seconds, ok):
+        """Enregistre le résultat d'un appel (seconds=None : latence non mesurée)."""
+        stats = self._model_stats(model)
+        if ok and seconds is not None:
+            stats.latencies.record(seconds)
+        with self._lock:
+            stats.outcomes.append(ok)
+
+    def p95(self, model, default=None):
+        return self._model_stats(model).latencies.percentile(0.95, default)
+
+    def healthy(self, route):
+        stats = self._model_stats(route.model)
+        p95 = stats.latencies.percentile(0.95)
+        with self._lock:
+            error_rate = stats.error_rate()
+        return error_rate <= self.max_error_rate and (p95 is None or p95 <= self.latency_slo)
+
+    def choose(self, features=None):
+        """Route à utiliser pour une requête (features=None : requête non classée)."""
+        cheap = features is not None and (
+            features.true_false
+            or (features.correct and features.prompt_chars <= self.short_prompt_chars)
+        )
+        order = [self.fast, self.default] if cheap else [self.default, self.fast]
+        candidates = [self.routes[name] for name in order]
+        for route in candidates:
+            if self.healthy(route):
+                return route
+        # Aucun modèle dans le SLO : le moins lent
+        return min(candidates, key=lambda r: self.p95(r.model, default=0.0))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Pré-chargement spéculatif des explications IA.
+
+Pendant que l'élève lit une question, on calcule déjà en tâche de fond
+les explications qu'il a le plus de chances de demander : celle de la bonne
+réponse et celles des mauvaises réponses les plus choisies (fréquences
+observées dans `AnswerStats`).
+
+Le pré-chargement ne doit pas affamer les vraies demandes :
+- pool de threads dédié et petit (plafond global de concurrence) ;
+- file bornée : au-delà de `max_pending`, les demandes sont abandonnées ;
+- quand l'élève passe à la question suivante, ses demandes pas encore
+  démarrées sont annulées (`cancel`).
+- un élève qui valide une réponse en cours de pré-chargement ne l'attend pas :
+  il fait sa propre demande, en priorité interactive (voir ExplanationCache).
+"""
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AnswerStats:
+    """Fréquences des réponses choisies, par identifiant canonique de question."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(Counter)
+
+    def record(self, question_id, choice):
+        with self._lock:
+            self._counts[question_id][choice] += 1
+
+    def counts(self, question_id):
+        """Copie de {choix: nombre de fois choisi} pour une question."""
+        with self._lock:
+            return dict(self._counts.get(question_id, {}))
+
+
+class Prefetcher:
+    """Exécute des tâches de pré-chargement, dédupliquées par clé et annulables par propriétaire."""
+
+    def __init__(self, max_workers=2, max_pending=64):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._pending = {}  # clé -> (propriétaire, future)
+        self._by_owner = defaultdict(set)  # propriétaire -> clés
+        self.dropped = 0
+
+    def submit(self, owner, key, fn, *args, **kwargs):
+        """
+        Planifie `fn(*args, **kwargs)` pour `owner`. Renvoie False si la clé est
+        déjà planifiée ou si la file est pleine (la demande est alors abandonnée).
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._pending[key] = (owner, future)
+            self._by_owner[owner].add(key)
+        # Hors du verrou : le callback peut s'exécuter tout de suite
+        future.add_done_callback(lambda _f, key=key: self._forget(key))
+        return True
+
+    def cancel(self, owner):
+        """Annule les tâches de `owner` pas encore démarrées (celles en cours vont au bout)."""
+        with self._lock:
+            futures = [
+                self._pending[key][1]
+                for key in self._by_owner.pop(owner, ())
+                if key in self._pending
+            ]
+        for future in futures:
+            future.cancel()
+
+    def _forget(self, key):
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                keys = self._by_owner.get(entry[0])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_owner[entry[0]]
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Pré-génère hors ligne toutes les explications IA de la banque de questions.
+
+    python pregenerate_explanations.py --workers 4 --rpm 30 --tpm 8000
+
+Chaque couple (question, réponse possible) est expliqué une fois et écrit dans
+le store SQLite que l'application consulte avant d'appeler Groq : en
+production, les questions connues ne coûtent plus aucun appel à l'API.
+Relancer la commande reprend là où elle s'était arrêtée (les explications
+déjà stockées sont sautées). En fin d'exécution, le journal WAL est reporté
+dans explications.sqlite3 : le fichier seul peut être committé et déployé.
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import quizzCompoRFavecIA as app
+from explanation_cache import make_key, make_question_key
+from explanation_store import ExplanationStore
+from groq_scheduler import BULK
+from question_bank import load_bank
+from question_identity import question_id
+
+
+def iter_jobs(questions, course=None, per_question=False):
+    """
+    Énumère les explications possibles, sans doublon : les questions répétées
+    d'un cours à l'autre (choix permutés) ne sont générées qu'une fois.
+    Éléments : (clé, identifiant de la question, question, index de la réponse élève),
+    l'index valant None en mode « une explication pour tous les choix » (per_question).
+    """
+    seen = set()
+    for q in questions:
+        if course is not None and q["course"] != course:
+            continue
+        qid = question_id(q["text"], q["choices"])
+        if per_question:
+            answers = [None]
+        else:
+            answers = range(1, len(q["choices"]) + 1)
+        for user_index in answers:
+            if user_index is None:
+                key = make_question_key(q["text"], q["choices"], q["answer"])
+            else:
+                key = make_key(q["text"], q["choices"], user_index, q["answer"])
+            if key in seen:
+                continue
+            seen.add(key)
+            yield key, qid, q, user_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pré-génère les explications IA de toute la banque de questions."
+    )
+    parser.add_argument("--db", default=app.EXPLANATION_DB_PATH, help="fichier SQLite des explications")
+    parser.add_argument("--bank", default=app.QUESTION_BANK_PATH, help="banque de questions (JSON ou SQLite)")
+    parser.add_argument("--workers", type=int, default=4, help="requêtes Groq simultanées")
+    parser.add_argument("--rpm", type=float, default=app.GROQ_RPM, help="requêtes par minute maximum")
+    parser.add_argument("--tpm", type=float, default=app.GROQ_TPM, help="tokens par minute maximum")
+    parser.add_argument("--course", type=int, help="ne traiter qu'un cours")
+    parser.add_argument("--dry-run", action="store_true", help="compter sans appeler Groq")
+    args = parser.parse_args(argv)
+
+    store = ExplanationStore(args.db, max_entries=app.EXPLANATION_DB_MAX_ENTRIES)
+    per_question = app.EXPLANATION_BACKEND == "question"
+    jobs = list(iter_jobs(load_bank(args.bank), args.course, per_question))
+    done = store.get_many(key for key, *_ in jobs)
+    todo = [job for job in jobs if job[0] not in done]
+    print(f"{len(jobs)} explications possibles, {len(done)} déjà stockées, {len(todo)} à générer.")
+
+    if args.dry_run or not todo:
+        return 0
+    if not app.GROQ_API_KEY:
+        print("Clé GROQ_API_KEY manquante : rien n'est généré.", file=sys.stderr)
+        return 1
+
+    # Limites de l'ordonnanceur de l'app (créé au premier appel) : débit et concurrence de la CLI
+    app.GROQ_RPM = args.rpm
+    app.GROQ_TPM = args.tpm
+    app.GROQ_MAX_CONCURRENCY = max(1, args.workers)
+
+    def generate(job):
+        key, qid, q, user_index = job
+        if user_index is None:
+            explanation = app._ask_groq_all_choices(q["text"], q["choices"], q["answer"], BULK)
+        else:
+            explanation = app._ask_groq(q["text"], q["choices"], user_index, q["answer"], BULK)
+        store.put(key, qid, explanation)
+
+    failures = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    futures = {pool.submit(generate, job): job for job in todo}
+    try:
+        for n, future in enumerate(as_completed(futures), 1):
+            q, user_index = futures[future][2:]
+            answer = "toutes les réponses" if user_index is None else f"réponse {user_index}"
+            label = f"[{n}/{len(todo)}] cours {q['course']}, {answer} : {q['text'][:50]}"
+            try:
+                future.result()
+            except Exception as exc:  # on continue : la prochaine exécution reprendra cet élément
+                failures += 1
+                print(f"{label} -> échec ({exc})", file=sys.stderr)
+            else:
+                print(label)
+        pool.shutdown()
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("\nInterrompu : relance la commande pour reprendre.", file=sys.stderr)
+        return 130
+    finally:
+        store.checkpoint()
+
+    if failures:
+        print(f"{failures} échec(s) : relance la commande pour les reprendre.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Banque de questions externe (JSON ou SQLite), chargée une fois par processus.
+
+Format JSON : une liste de {"course", "text", "choices", "answer"} (answer est
+l'index 1-based de la bonne réponse). Format SQLite : table `questions`
+(voir _SCHEMA), remplie par l'import Moodle (`append_questions`).
+
+`QuestionBank` est immuable et précalcule les index utiles à l'application :
+positions des questions de chaque cours, position d'une question à partir de
+son identifiant canonique. `BankLoader` relit le fichier quand sa date de
+modification change (vérifiée au plus toutes les `check_interval` secondes).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+from question_identity import question_id
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    position INTEGER PRIMARY KEY,
+    question_id TEXT NOT NULL,
+    course INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    choices TEXT NOT NULL,
+    answer INTEGER NOT NULL,
+    UNIQUE (course, question_id)
+);
+"""
+
+
+def validate_question(q):
+    """Renvoie la question normalisée (choix en tuple) ; lève ValueError si elle est invalide."""
+    try:
+        course, text, choices, answer = q["course"], q["text"], q["choices"], q["answer"]
+    except (KeyError, TypeError):
+        raise ValueError("champs attendus : course, text, choices, answer") from None
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("énoncé vide")
+    if (
+        not isinstance(choices, (list, tuple))
+        or len(choices) < 2
+        or not all(isinstance(c, str) and c.strip() for c in choices)
+    ):
+        raise ValueError("il faut au moins deux choix non vides")
+    if isinstance(answer, bool) or not isinstance(answer, int) or not 1 <= answer <= len(choices):
+        raise ValueError(f"answer doit être un index entre 1 et {len(choices)}")
+    if isinstance(course, bool) or not isinstance(course, int):
+        raise ValueError("course doit être un numéro de cours")
+    return {"course": course, "text": text, "choices": tuple(choices), "answer": answer}
+
+
+class QuestionBank:
+    """Questions (lecture seule) et index ; `version` change à chaque rechargement."""
+
+    def __init__(self, questions, version=None):
+        items, ids, by_id, by_course = [], [], {}, {}
+        for n, q in enumerate(questions, 1):
+            try:
+                q = validate_question(q)
+            except ValueError as exc:
+                raise ValueError(f"question {n} : {exc}") from None
+            qid = question_id(q["text"], q["choices"])
+            position = len(items)
+            # Même question (aux permutations près) dans plusieurs cours : gardée
+            # une fois par cours, l'identifiant renvoie à la première
+            by_id.setdefault(qid, position)
+            by_course.setdefault(q["course"], []).append(position)
+            items.append(MappingProxyType(q))
+            ids.append(qid)
+        self.questions = tuple(items)
+        self.ids = tuple(ids)
+        self.courses = tuple(sorted(by_course))
+        self.version = version
+        self._by_id = by_id
+        self._by_course = {course: tuple(positions) for course, positions in by_course.items()}
+        self._all = tuple(range(len(items)))
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, position):
+        return self.questions[position]
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def positions(self, course=None):
+        """Positions des questions d'un cours (None : toute la banque)."""
+        if course is None:
+            return self._all
+        return self._by_course.get(course, ())
+
+    def position(self, qid):
+        """Position de la question d'identifiant `qid`, ou None."""
+        return self._by_id.get(qid)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("le fichier JSON doit contenir une liste de questions")
+    return data
+
+
+def _read_sqlite(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    try:
+        rows = conn.execute(
+            "SELECT course, text, choices, answer FROM questions ORDER BY position"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"course": course, "text": text, "choices": json.loads(choices), "answer": answer}
+        for course, text, choices, answer in rows
+    ]
+
+
+def append_questions(path, questions, batch_size=1000):
+    """
+    Ajoute des questions validées (voir validate_question) à une banque SQLite,
+    créée au besoin, par transactions de `batch_size` questions. Une question
+    déjà présente dans le même cours (aux permutations des choix près) est
+    ignorée. Renvoie le nombre de questions ajoutées.
+
+    La base reste en journal classique (pas de WAL) : chaque transaction modifie
+    le fichier lui-même, et donc sa date, ce qui déclenche le rechargement à chaud.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.executescript(_SCHEMA)
+        before = conn.total_changes
+
+        def flush(rows):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO questions (question_id, course, text, choices, answer) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+        rows = []
+        for q in questions:
+            rows.append((
+                question_id(q["text"], q["choices"], cached=False),
+                q["course"],
+                q["text"],
+                json.dumps(list(q["choices"]), ensure_ascii=False),
+                q["answer"],
+            ))
+            if len(rows) >= batch_size:
+                flush(rows)
+                rows = []
+        if rows:
+            flush(rows)
+        return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def load_bank(path):
+    """Charge la banque depuis un fichier .json ou SQLite (toute autre extension)."""
+    version = os.stat(path).st_mtime_ns
+    reader = _read_json if path.endswith(".json") else _read_sqlite
+    return QuestionBank(reader(path), version=version)
+
+
+class BankLoader:
+    """
+    Banque partagée, rechargée quand le fichier change. Un fichier illisible
+    (ex. en cours d'édition) est ignoré : on garde la version précédente.
+    """
+
+    def __init__(self, path, check_interval=2.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._bank = load_bank(path)
+        self._checked_at = clock()
+        self._rejected = None  # date du dernier fichier illisible
+        self.error = None
+
+    def get(self):
+        now = self._clock()
+        if now - self._checked_at < self.check_interval:
+            return self._bank
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._reload_if_changed()
+            return self._bank
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as exc:
+            self.error = str(exc)
+            return
+        if mtime in (self._bank.version, self._rejected):
+            return
+        try:
+            self._bank = load_bank(self.path)
+        except ValueError as exc:
+            # Contenu invalide : inutile de relire ce fichier avant sa prochaine modification
+            self._rejected = mtime
+            self.error = str(exc)
+        except (OSError, sqlite3.Error) as exc:
+            # Ex. base verrouillée pendant un import : nouvel essai à la prochaine vérification
+            self.error = str(exc)
+        else:
+            self._rejected = None
+            self.error = None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Identité canonique des questions.
+
+La même question apparaît dans plusieurs cours avec ses choix mélangés
+(ex. « Les contacts ohmiques d'une diode sont » en cours 2, 3 et 5).
+On lui donne un identifiant stable, calculé sur l'énoncé normalisé et
+l'ensemble trié des choix, et on ramène les index de réponse (1-based)
+sur les positions canoniques : une seule explication, une seule statistique
+et une seule entrée de cache servent toutes les permutations.
+"""
+import functools
+import hashlib
+import json
+import unicodedata
+from typing import NamedTuple
+
+
+def normalize_text(text):
+    """Normalise un texte pour les comparaisons : unicode NFC, espaces compactés, casse ignorée."""
+    text = unicodedata.normalize("NFC", text).replace("’", "'")
+    return " ".join(text.split()).casefold()
+
+
+class CanonicalQuestion(NamedTuple):
+    id: str
+    text: str
+    choices: tuple  # choix dans l'ordre canonique
+    positions: tuple  # positions[i - 1] = position canonique (1-based) du choix i d'origine
+
+    def to_canonical(self, index):
+        """Index 1-based dans la question d'origine -> index 1-based canonique."""
+        return self.positions[index - 1]
+
+    def from_canonical(self, index):
+        """Index 1-based canonique -> index 1-based dans la question d'origine."""
+        return self.positions.index(index) + 1
+
+
+def _canonical_form(text, choices):
+    normalized = [normalize_text(c) for c in choices]
+    order = sorted(range(len(choices)), key=lambda i: normalized[i])
+    positions = [0] * len(choices)
+    for canonical_index, original_index in enumerate(order):
+        positions[original_index] = canonical_index + 1
+
+    payload = json.dumps(
+        [normalize_text(text), [normalized[i] for i in order]],
+        ensure_ascii=False,
+    )
+    return CanonicalQuestion(
+        id=hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32],
+        text=text.strip(),
+        choices=tuple(choices[i] for i in order),
+        positions=tuple(positions),
+    )
+
+
+_canonicalize = functools.lru_cache(maxsize=65536)(_canonical_form)
+
+
+def canonicalize(question_text, choices):
+    """Forme canonique d'une question (résultat mis en cache)."""
+    return _canonicalize(question_text, tuple(choices))
+
+
+def question_id(question_text, choices, cached=True):
+    """
+    Identifiant stable d'une question, indépendant de l'ordre de ses choix.
+    cached=False : sans passer par le cache (imports en masse).
+    """
+    if not cached:
+        return _canonical_form(question_text, tuple(choices)).id
+    return canonicalize(question_text, choices).id
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Tirage des questions d'un quiz de longueur fixe.
+
+Les k questions sont réparties entre les cours proportionnellement à leur
+taille (méthode des plus forts restes), puis tirées dans chaque cours par index
+aléatoires, sans copier ni mélanger la liste du cours : le coût est O(k) et non
+O(taille de la banque). Les questions vues récemment (`avoid`) sont évitées
+tant qu'il en reste d'autres dans le cours.
+
+Avec des poids (ex. difficulté des questions, voir answer_analytics), le tirage
+dans chaque cours se fait sans remise avec une probabilité proportionnelle au
+poids (clés d'Efraimidis-Spirakis, vectorisé) : O(taille du cours).
+"""
+import random
+
+import numpy as np
+
+
+def allocate(sizes, k, rng=random):
+    """Nombre de questions à tirer dans chaque strate, proportionnel à `sizes`, total min(k, somme)."""
+    total = sum(sizes)
+    if k >= total:
+        return list(sizes)
+    quotas = [k * size / total for size in sizes]
+    counts = [int(q) for q in quotas]
+    # Plus forts restes, ex aequo départagés au hasard
+    order = sorted(range(len(sizes)), key=lambda i: (quotas[i] - counts[i], rng.random()), reverse=True)
+    for i in order[:k - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def _draw(positions, m, rng, avoid):
+    """`m` positions distinctes de `positions` (séquence indexable), de préférence hors `avoid`."""
+    n = len(positions)
+    if m >= n:
+        return list(positions)
+    picked, tried, seen = [], set(), []
+    # Tirage avec rejet, borné : suffisant tant que les questions vues sont minoritaires
+    for _ in range(3 * m + 10):
+        if len(picked) == m:
+            return picked
+        i = rng.randrange(n)
+        if i in tried:
+            continue
+        tried.add(i)
+        (seen if positions[i] in avoid else picked).append(positions[i])
+    if len(picked) < m:
+        # Cours presque entièrement vu : parcours complet, rare
+        rest = [p for i, p in enumerate(positions) if i not in tried and p not in avoid]
+        picked += rng.sample(rest, min(m - len(picked), len(rest)))
+    if len(picked) < m:
+        seen += [p for i, p in enumerate(positions) if i not in tried and p in avoid]
+        picked += rng.sample(seen, m - len(picked))
+    return picked
+
+
+def _weighted_order(positions, rng, weights, avoid=frozenset()):
+    """
+    `positions` dans un ordre aléatoire où les poids forts tendent à venir en premier
+    (tirage successif sans remise proportionnel aux poids), celles de `avoid` en dernier.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    generator = np.random.default_rng(rng.getrandbits(64))
+    keys = np.log(generator.random(len(positions))) / np.asarray(weights, dtype=np.float64)[positions]
+    avoided = np.isin(positions, np.fromiter(avoid, dtype=np.int64, count=len(avoid)))
+    return positions[np.lexsort((-keys, avoided))].tolist()
+
+
+def sample_positions(bank, k=None, course=None, rng=random, avoid=frozenset(), weights=None):
+    """
+    Positions des questions d'un quiz, dans un ordre aléatoire : toutes celles du
+    cours (ou de la banque si course=None) si k vaut None, sinon k tirées par strates.
+    `weights` (poids > 0 indexés par position dans la banque) favorise certaines
+    questions : plus souvent tirées, et plus tôt quand k vaut None.
+    """
+    if k is None:
+        if weights is not None:
+            return _weighted_order(bank.positions(course), rng, weights)
+        positions = list(bank.positions(course))
+        rng.shuffle(positions)
+        return positions
+
+    courses = bank.courses if course is None else (course,)
+    strata = [bank.positions(c) for c in courses]
+    picked = []
+    for positions, m in zip(strata, allocate([len(p) for p in strata], k, rng)):
+        if weights is not None:
+            picked += _weighted_order(positions, rng, weights, avoid)[:m]
+        else:
+            picked += _draw(positions, m, rng, avoid)
+    rng.shuffle(picked)
+    return picked
@@ -1,667 +1,1357 @@
 # -*- coding: utf-8 -*-
+import base64
 import os
-import random
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
-from openai import OpenAI  # client compatible Groq
+
+import batch_explanations
+from answer_analytics import AnswerAnalytics
+from answer_log import AnswerEvent, AnswerLog
+import choice_explanations
+from explanation_cache import ExplanationCache, make_key, make_question_key
+from explanation_store import ExplanationStore
+from groq_scheduler import BULK, INTERACTIVE, PREFETCH, GroqScheduler, Overloaded
+from model_router import ModelRouter, question_features
+from prefetch import AnswerStats, Prefetcher
+from question_bank import BankLoader
+from question_identity import canonicalize, normalize_text, question_id
+from quiz_sampling import sample_positions
+from resilience import Cancelled, CircuitBreaker, CircuitOpen, DeadlineExceeded, hedged_call
+from shared_cache import RedisExplanationStore
+from session_store import SessionStore
+from similar_questions import SimilarityIndex
+from spaced_repetition import LearnerStore, LeitnerSchedule, next_review
+from token_usage import UsageMeter
 
 
 # ================== CLIENT GROQ ==================
 # La clé est lue en priorité dans les secrets Streamlit,
 # sinon dans la variable d'environnement GROQ_API_KEY.
-GROQ_API_KEY = st.secrets.get("GROQ_API_KEY", os.getenv("GROQ_API_KEY"))
+def _read_secret(name):
+    """Secret Streamlit, sinon variable d'environnement (ex. sans secrets.toml ou hors `streamlit run`)."""
+    try:
+        return st.secrets.get(name, os.getenv(name))
+    except FileNotFoundError:
+        return os.getenv(name)
+
+
+GROQ_API_KEY = _read_secret("GROQ_API_KEY")
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Connexions HTTP vers Groq : taille du pool, durée de keep-alive et délais (s)
+GROQ_MAX_CONNECTIONS = 32
+GROQ_KEEPALIVE_EXPIRY = 120
+GROQ_CONNECT_TIMEOUT = 5
+GROQ_READ_TIMEOUT = 60
+# Connexions ouvertes dès le démarrage pour ne pas payer DNS + TLS à la
+# première explication (0 = pas de préchauffage)
+GROQ_WARMUP_CONNECTIONS = int(os.getenv("QUIZZ_GROQ_WARMUP", "0"))
+
+# Limites de l'API Groq pour le processus : requêtes et tokens par minute,
+# requêtes simultanées, file d'attente max, attente max (s), nouveaux essais
+GROQ_RPM = float(os.getenv("QUIZZ_GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("QUIZZ_GROQ_TPM", "8000"))
+GROQ_MAX_CONCURRENCY = 8
+GROQ_MAX_QUEUE = 200
+GROQ_MAX_WAIT = 20
+GROQ_MAX_RETRIES = 4
+# Tokens de sortie comptés d'avance pour chaque requête
+GROQ_OUTPUT_TOKENS_ESTIMATE = 400
+
+# Latence de queue : délai max d'un appel (s, hors pré-génération) ; requête de
+# secours lancée après le p95 observé, borné entre les deux délais ci-dessous (s) ;
+# disjoncteur ouvert après N échecs de suite, nouvel essai au bout de X s.
+# Les appels groupés (fin de quiz, JSON « toutes les réponses ») sont plus longs
+# et trop chers pour être doublés : délai GROQ_LONG_DEADLINE, sans requête de secours
+GROQ_DEADLINE = float(os.getenv("QUIZZ_GROQ_DEADLINE", "15"))
+GROQ_LONG_DEADLINE = float(os.getenv("QUIZZ_GROQ_LONG_DEADLINE", "60"))
+GROQ_HEDGE_MIN_DELAY = 1.0
+GROQ_HEDGE_MAX_DELAY = 5.0
+GROQ_BREAKER_FAILURES = 5
+GROQ_BREAKER_RESET = 30
+
+# Cache des explications partagé entre les sessions (taille max, durée de vie en s)
+EXPLANATION_CACHE_SIZE = 2048
+EXPLANATION_CACHE_TTL = 7 * 24 * 3600
+
+# Stockage SQLite des explications, conservé entre les redémarrages
+EXPLANATION_DB_PATH = os.getenv(
+    "QUIZZ_EXPLANATION_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "explications.sqlite3"),
+)
+EXPLANATION_DB_MAX_ENTRIES = 50_000
 
-client = OpenAI(
-    api_key=GROQ_API_KEY,
-    base_url="https://api.groq.com/openai/v1",
+# Plusieurs réplicas du serveur : store commun à tous. « redis://hôte:port/base »
+# pour un serveur Redis ; sinon le fichier SQLite ci-dessus, partagé par les
+# processus d'une même machine. Un seul réplica génère une explication donnée
+# (bail de EXPLANATION_LEASE_TTL s) ; les autres attendent son résultat au plus
+# EXPLANATION_LEASE_WAIT s avant de la demander eux-mêmes à Groq
+SHARED_CACHE_URL = os.getenv("QUIZZ_SHARED_CACHE", "")
+EXPLANATION_LEASE_TTL = 30.0
+EXPLANATION_LEASE_WAIT = 20.0
+
+# Journal des réponses (une ligne par validation), écrit par lots en tâche de fond
+ANSWER_LOG_PATH = os.getenv(
+    "QUIZZ_ANSWER_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reponses.sqlite3"),
+)
+ANSWER_LOG_BATCH_SIZE = 256
+ANSWER_LOG_FLUSH_INTERVAL = 1.0
+ANSWER_LOG_MAX_PENDING = 10_000
+# Statistiques tirées du journal (voir answer_analytics), relues au plus toutes les
+# ANSWER_STATS_REFRESH s. Option « questions difficiles » : poids de tirage
+# = QUIZ_DIFFICULTY_FLOOR + taux d'erreur lissé de la question
+ANSWER_STATS_REFRESH = 10.0
+QUIZ_DIFFICULTY_FLOOR = 0.2
+
+# Révision espacée : boîtes et échéances de chaque élève (voir spaced_repetition).
+# L'élève est reconnu par le paramètre « eleve » de l'adresse de la page
+LEARNER_DB_PATH = os.getenv(
+    "QUIZZ_LEARNER_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "eleves.sqlite3"),
+)
+
+# Parties en cours, reprises après un rechargement de la page grâce au paramètre
+# « reprise » de son adresse ; écrites par lots toutes les SESSION_FLUSH_INTERVAL s,
+# oubliées au bout de SESSION_MAX_AGE s sans activité
+SESSION_DB_PATH = os.getenv(
+    "QUIZZ_SESSION_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.sqlite3"),
 )
+SESSION_FLUSH_INTERVAL = 1.0
+SESSION_MAX_AGE = 30 * 24 * 3600
+
+# Banque de questions : questions.json à côté du script, ou une base SQLite
+# remplie par l'import Moodle. Le fichier est relu s'il a changé, vérification
+# au plus toutes les QUESTION_BANK_CHECK_INTERVAL secondes
+QUESTION_BANK_PATH = os.getenv(
+    "QUIZZ_QUESTION_BANK",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json"),
+)
+QUESTION_BANK_CHECK_INTERVAL = 2.0
+
+# Longueurs de quiz proposées (None : toutes les questions), tirées en proportion
+# de la taille des cours ; une session évite ses RECENT_QUESTIONS dernières questions
+QUIZ_LENGTHS = [10, 20, 50, None]
+RECENT_QUESTIONS = 500
+
+# Questions quasi identiques (similarité cosinus 0-1, voir similar_questions) :
+# au-dessus de SIMILAR_REUSE_THRESHOLD, l'explication déjà connue est reprise telle
+# quelle si les deux réponses concernées figurent dans l'autre question (jamais pour
+# un simple Vrai/Faux : une négation suffit à inverser la réponse) ; au-dessus de
+# SIMILAR_CONTEXT_THRESHOLD, elle est seulement donnée au modèle comme contexte
+SIMILAR_REUSE_THRESHOLD = float(os.getenv("QUIZZ_SIMILAR_REUSE", "0.97"))
+SIMILAR_CONTEXT_THRESHOLD = float(os.getenv("QUIZZ_SIMILAR_CONTEXT", "0.7"))
+TRUE_FALSE_CHOICES = {"vrai", "faux"}
+
+# Mode « en arrière-plan » : threads qui calculent les explications,
+# et fréquence (s) à laquelle la page vérifie si l'explication est prête
+EXPLANATION_WORKERS = 8
+EXPLANATION_POLL_INTERVAL = 0.5
+
+EXPLANATION_MODES = ["Immédiate", "En arrière-plan", "Streaming", "En fin de quiz"]
+
+# Mode « en fin de quiz » : taille max d'une requête groupée (questions, caractères de prompt)
+BATCH_MAX_ITEMS = 15
+BATCH_MAX_CHARS = 12_000
+
+# Pré-chargement des explications de la question affichée (option de la barre latérale) :
+# threads dédiés (plafond global), file max, nombre de mauvaises réponses anticipées
+PREFETCH_WORKERS = 2
+PREFETCH_MAX_PENDING = 64
+PREFETCH_WRONG_ANSWERS = 1
+
+# "answer" : une explication par (question, réponse élève) ;
+# "question" : un seul appel par question qui explique tous les choix (JSON)
+EXPLANATION_BACKEND = os.getenv("QUIZZ_EXPLANATION_BACKEND", "answer")
+
+# Modèles Groq, à adapter si tu veux : nom de route -> (modèle, max_output_tokens).
+# « rapide » sert les explications simples (Vrai/Faux, bonne réponse avec prompt
+# court), « standard » les autres, tant que son p95 reste sous GROQ_LATENCY_SLO (s)
+GROQ_ROUTES = {
+    "rapide": ("llama-3.1-8b-instant", 300),
+    "standard": ("openai/gpt-oss-20b", 1024),
+}
+GROQ_LATENCY_SLO = 3.0
+GROQ_MAX_ERROR_RATE = 0.2
+# Longueur (caractères) de la partie variable du prompt en deçà de laquelle il est « court »
+GROQ_SHORT_PROMPT_CHARS = 500
+# Partie statique du prompt d'explication, envoyée en tête de chaque requête et
+# identique d'un appel à l'autre : le fournisseur peut mettre ce préfixe en cache.
+# Les données de la question suivent dans une partie variable compacte (_build_prompt).
+GROQ_INSTRUCTIONS = """Tu es un professeur qui explique simplement l'électronique et les \
+semi-conducteurs à des élèves de l'ENSEA. On te donne une question de quiz, ses choix \
+numérotés, le numéro choisi par l'élève et celui de la bonne réponse.
+1. Explique en quelques phrases pourquoi la bonne réponse est correcte.
+2. Si la réponse de l'élève est fausse, explique en quoi sa réponse est trompeuse.
+3. Reste concis et pédagogique, en français.
+4. Désigne les réponses par leur texte, pas par leur numéro.
+5. Si l'explication d'une question proche est fournie, reste cohérent avec elle sans la recopier."""
+
+# Affiche dans la barre latérale les tokens consommés par modèle et le nombre
+# d'exécutions complètes du script par réponse validée
+SHOW_STATS = os.getenv("QUIZZ_SHOW_STATS") == "1"
+
+MISSING_KEY_MESSAGE = (
+    "L'IA d'explication n'est pas configurée (clé GROQ_API_KEY manquante).\n"
+    "Tu peux l'ajouter dans .streamlit/secrets.toml pour activer cette fonction."
+)
+
+BUSY_MESSAGE = (
+    "L'IA est indisponible ou très sollicitée en ce moment, "
+    "l'explication n'a pas pu être générée.\n"
+    "Réessaie un peu plus tard."
+)
+
+
+@st.cache_resource(show_spinner=False)
+def _groq_client():
+    """
+    Client Groq (API compatible OpenAI) unique pour tout le processus, créé au
+    premier besoin avec un pool de connexions keep-alive. openai n'est importé
+    qu'ici : sans clé GROQ_API_KEY, l'application ne le charge jamais.
+    """
+    import httpx
+    from openai import OpenAI  # client compatible Groq
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(GROQ_READ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+    )
+    # max_retries=0 : les nouveaux essais sont gérés par l'ordonnanceur (_scheduler)
+    client = OpenAI(
+        api_key=GROQ_API_KEY,
+        base_url=GROQ_BASE_URL,
+        http_client=http_client,
+        max_retries=0,
+    )
+    if GROQ_WARMUP_CONNECTIONS > 0:
+        threading.Thread(target=_warm_up, args=(client,), name="groq-warmup", daemon=True).start()
+    return client
+
+
+def _warm_up(client):
+    """Ouvre GROQ_WARMUP_CONNECTIONS connexions en parallèle avec une requête légère."""
+    def ping():
+        try:
+            client.models.list()
+        except Exception:
+            pass  # un préchauffage raté n'empêche pas l'application de fonctionner
+
+    threads = [threading.Thread(target=ping, daemon=True) for _ in range(GROQ_WARMUP_CONNECTIONS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _is_retryable(exc):
+    """Erreurs Groq qui valent un nouvel essai : 429, 5xx, connexion, délai dépassé."""
+    import openai
+
+    if isinstance(exc, openai.APIConnectionError):  # inclut APITimeoutError
+        return True
+    return isinstance(exc, openai.APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+@st.cache_resource(show_spinner=False)
+def _scheduler():
+    """Ordonnanceur unique : toutes les sessions partagent le débit autorisé par Groq."""
+    return GroqScheduler(
+        rpm=GROQ_RPM,
+        tpm=GROQ_TPM,
+        max_concurrency=GROQ_MAX_CONCURRENCY,
+        max_queue=GROQ_MAX_QUEUE,
+        max_wait=GROQ_MAX_WAIT,
+        max_retries=GROQ_MAX_RETRIES,
+        is_retryable=_is_retryable,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _circuit_breaker():
+    """Disjoncteur commun : une panne de Groq coupe les appels de toutes les sessions."""
+    return CircuitBreaker(failure_threshold=GROQ_BREAKER_FAILURES, reset_timeout=GROQ_BREAKER_RESET)
+
+
+@st.cache_resource(show_spinner=False)
+def _model_router():
+    """Routage des modèles, avec les latences et erreurs observées par tout le processus."""
+    return ModelRouter(
+        GROQ_ROUTES,
+        latency_slo=GROQ_LATENCY_SLO,
+        max_error_rate=GROQ_MAX_ERROR_RATE,
+        short_prompt_chars=GROQ_SHORT_PROMPT_CHARS,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _usage_meter():
+    """Tokens consommés par modèle depuis le démarrage du processus."""
+    return UsageMeter()
+
+
+@st.cache_resource(show_spinner=False)
+def _hedge_executor():
+    """Threads qui portent les appels Groq soumis à délai (requête principale + secours)."""
+    return ThreadPoolExecutor(max_workers=4 * GROQ_MAX_CONCURRENCY, thread_name_prefix="groq")
+
+
+class EmptyCompletion(Exception):
+    """
+    Groq n'a pas rendu d'explication complète (texte vide, réponse tronquée par
+    max_output_tokens, flux interrompu) : rien à mettre en cache.
+    """
+
+
+def _unavailable(exc):
+    """True si l'erreur signifie « Groq saturé ou en panne » : on sert alors un repli."""
+    return isinstance(exc, (Overloaded, CircuitOpen, DeadlineExceeded, EmptyCompletion)) or _is_retryable(exc)
+
+
+@st.cache_resource(show_spinner=False)
+def _explanation_cache():
+    """Un seul cache par processus, commun à toutes les sessions Streamlit."""
+    return ExplanationCache(maxsize=EXPLANATION_CACHE_SIZE, ttl=EXPLANATION_CACHE_TTL)
+
+
+@st.cache_resource(show_spinner=False)
+def _explanation_store():
+    """
+    Store persistant, partagé avec les autres réplicas (Redis ou fichier SQLite) ;
+    au démarrage on oublie les questions modifiées ou retirées.
+    """
+    if SHARED_CACHE_URL.startswith(("redis://", "rediss://")):
+        # Entrées expirées par Redis (TTL) : pas de nettoyage au démarrage
+        return RedisExplanationStore(
+            SHARED_CACHE_URL,
+            ttl=EXPLANATION_CACHE_TTL,
+            lease_ttl=EXPLANATION_LEASE_TTL,
+            wait_timeout=EXPLANATION_LEASE_WAIT,
+        )
+    store = ExplanationStore(
+        EXPLANATION_DB_PATH,
+        max_entries=EXPLANATION_DB_MAX_ENTRIES,
+        lease_ttl=EXPLANATION_LEASE_TTL,
+        wait_timeout=EXPLANATION_LEASE_WAIT,
+    )
+    store.prune(set(_question_bank().ids))
+    return store
 
 
-def get_ai_explanation(question_text, choices, user_index, correct_index):
+@st.cache_resource(show_spinner=False)
+def _answer_log():
+    """Journal des réponses, commun à toutes les sessions du processus."""
+    return AnswerLog(
+        ANSWER_LOG_PATH,
+        batch_size=ANSWER_LOG_BATCH_SIZE,
+        flush_interval=ANSWER_LOG_FLUSH_INTERVAL,
+        max_pending=ANSWER_LOG_MAX_PENDING,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _answer_analytics():
+    """Agrégats du journal des réponses, mis à jour en tâche de fond."""
+    return AnswerAnalytics(ANSWER_LOG_PATH, check_interval=ANSWER_STATS_REFRESH)
+
+
+def _answer_statistics():
+    """Statistiques courantes ; lance leur mise à jour si elles datent de plus de ANSWER_STATS_REFRESH s."""
+    analytics = _answer_analytics()
+    analytics.refresh(wait=False)
+    return analytics
+
+
+@st.cache_resource(show_spinner=False)
+def _learner_store():
+    """Progression des élèves en révision espacée, commune à toutes les sessions."""
+    return LearnerStore(LEARNER_DB_PATH)
+
+
+@st.cache_resource(show_spinner=False)
+def _session_store():
+    """Parties en cours de toutes les sessions ; au démarrage on oublie les plus anciennes."""
+    store = SessionStore(SESSION_DB_PATH, flush_interval=SESSION_FLUSH_INTERVAL)
+    store.expire(SESSION_MAX_AGE)
+    return store
+
+
+def _learner_id():
+    """Identifiant de l'élève, lu dans l'adresse de la page (créé au premier besoin)."""
+    learner = st.query_params.get("eleve")
+    if not learner:
+        learner = st.query_params["eleve"] = uuid.uuid4().hex[:16]
+    return learner
+
+
+@st.cache_resource(show_spinner=False)
+def _similarity_index():
+    """Index de similarité de la banque, pour profiter des explications des quasi-doublons."""
+    return SimilarityIndex()
+
+
+@st.cache_resource(show_spinner=False)
+def _explanation_executor():
+    """Pool de threads partagé pour les explications calculées en arrière-plan."""
+    return ThreadPoolExecutor(max_workers=EXPLANATION_WORKERS, thread_name_prefix="explication")
+
+
+@st.cache_resource(show_spinner=False)
+def _prefetcher():
+    """Pool de pré-chargement partagé, volontairement petit pour ne pas gêner les vraies demandes."""
+    return Prefetcher(max_workers=PREFETCH_WORKERS, max_pending=PREFETCH_MAX_PENDING)
+
+
+@st.cache_resource(show_spinner=False)
+def _answer_stats():
+    """Fréquences des réponses choisies par tous les élèves du processus."""
+    return AnswerStats()
+
+
+def get_ai_explanation(question_text, choices, user_index, correct_index, priority=INTERACTIVE):
     """
     Utilise Groq (API OpenAI-compatible) pour expliquer la bonne réponse
     et pourquoi la réponse donnée est juste ou fausse.
     Les index sont 1-based comme dans ton quiz.
+    Les explications sont mises en cache (mémoire puis SQLite) : une même
+    (question, réponse) n'est demandée qu'une fois à Groq, même par des
+    sessions simultanées ou après un redémarrage du serveur. Les questions
+    répétées dans plusieurs cours (choix permutés) partagent leurs explications,
+    et celles d'une question quasi identique déjà expliquée sont reprises.
+    Si Groq est saturé, renvoie un message de repli au lieu de lever une exception.
     """
     # Si la clé n'est pas configurée, on renvoie un message simple
     if not GROQ_API_KEY:
-        return (
-            "L'IA d'explication n'est pas configurée (clé GROQ_API_KEY manquante).\n"
-            "Tu peux l'ajouter dans .streamlit/secrets.toml pour activer cette fonction."
+        return MISSING_KEY_MESSAGE
+
+    try:
+        if EXPLANATION_BACKEND == "question":
+            try:
+                return _compose_from_choice_explanations(
+                    question_text, choices, user_index, correct_index, priority
+                )
+            except ValueError:
+                pass  # JSON inutilisable : on se rabat sur l'explication classique
+
+        return _cached_explanation(
+            make_key(question_text, choices, user_index, correct_index),
+            question_id(question_text, choices),
+            lambda: _explain_new(question_text, choices, user_index, correct_index, priority),
+            priority,
         )
+    except Exception as exc:
+        if _unavailable(exc):
+            return _degraded_explanation(question_text, choices, user_index, correct_index)
+        raise
 
-    user_answer = choices[user_index - 1]
-    correct_answer = choices[correct_index - 1]
 
-    prompt = f"""
-Tu es un professeur qui explique simplement l'électronique et les semi-conducteurs à un élève.
+def _degraded_explanation(question_text, choices, user_index, correct_index):
+    """
+    Repli quand Groq ne répond pas : une explication déjà connue sous l'autre
+    backend (par réponse ou « toutes les réponses »), sinon BUSY_MESSAGE.
+    """
+    cache = _explanation_cache()
+    store = _explanation_store()
+    key = make_key(question_text, choices, user_index, correct_index)
+    explanation = cache.get(key) or store.get(key)
+    if explanation is not None:
+        return explanation
 
-Question :
-{question_text}
+    payload = store.get(make_question_key(question_text, choices, correct_index))
+    if payload is None:
+        return BUSY_MESSAGE
+    canon = canonicalize(question_text, choices)
+    return choice_explanations.compose(
+        choice_explanations.loads(payload),
+        canon.choices,
+        canon.to_canonical(user_index),
+        canon.to_canonical(correct_index),
+    )
 
-Choix possibles :
-""" + "\n".join([f"{i+1}. {c}" for i, c in enumerate(choices)]) + f"""
 
-Réponse de l'élève : {user_index}. {user_answer}
-Bonne réponse : {correct_index}. {correct_answer}
+# Marque posée par le thread qui doit générer une explication absente des caches
+# (voir _timed_explanation)
+_cache_miss = threading.local()
+
+
+def _cached_explanation(key, qid, generate, priority=INTERACTIVE):
+    """
+    Cache mémoire, puis store partagé, puis `generate()` : une seule fois par clé
+    dans le processus (cache mémoire) et entre les réplicas (bail du store).
+    Un élève n'attend jamais un pré-chargement en cours sur la même clé (il
+    pourrait être abandonné par l'ordonnanceur) : il fait sa propre demande.
+    """
+    store = _explanation_store()
+
+    def generate_missing():
+        _cache_miss.flag = True
+        return generate()
+
+    return _explanation_cache().get_or_compute(
+        key,
+        lambda: store.get_or_compute(key, qid, generate_missing, lease=priority == INTERACTIVE),
+        priority,
+    )
 
-1. Explique en quelques phrases pourquoi la bonne réponse est correcte.
-2. Si la réponse de l'élève est fausse, explique en quoi sa réponse est trompeuse.
-3. Reste concis, niveau ENSEA, en français.
-"""
 
-    response = client.responses.create(
-        model="openai/gpt-oss-20b",  # modèle Groq, à adapter si tu veux
-        input=prompt,
-        instructions="Réponds en français, de manière pédagogique mais concise.",
+def _timed_explanation(explain, *args, **kwargs):
+    """(résultat de `explain`, durée en s, True si l'explication venait d'un cache)."""
+    _cache_miss.flag = False
+    start = time.monotonic()
+    result = explain(*args, **kwargs)
+    return result, time.monotonic() - start, not _cache_miss.flag
+
+
+def _similar_explanation(question_text, choices, user_index, correct_index):
+    """
+    Cherche une question quasi identique déjà expliquée. Renvoie (explication
+    réutilisable, contexte pour le prompt), l'une et l'autre pouvant valoir None.
+    """
+    bank = _question_bank()
+    index = _similarity_index()
+    index.refresh(bank, bank.version)
+    matches = index.query(question_text, choices, threshold=SIMILAR_CONTEXT_THRESHOLD)
+    qid = question_id(question_text, choices)
+    user_answer = normalize_text(choices[user_index - 1])
+    correct_answer = normalize_text(choices[correct_index - 1])
+    # Vrai/Faux : les choix ne disent rien de la question, seule la reprise comme contexte est sûre
+    reusable = not {normalize_text(c) for c in choices} <= TRUE_FALSE_CHOICES
+    cache = _explanation_cache()
+    store = _explanation_store()
+    context = None
+    for match in matches:
+        other = match.question
+        if question_id(other["text"], other["choices"]) == qid:
+            continue
+        other_choices = [normalize_text(c) for c in other["choices"]]
+        if (
+            reusable
+            and match.score >= SIMILAR_REUSE_THRESHOLD
+            and user_answer in other_choices
+            and correct_answer in other_choices
+        ):
+            key = make_key(
+                other["text"],
+                other["choices"],
+                other_choices.index(user_answer) + 1,
+                other_choices.index(correct_answer) + 1,
+            )
+            explanation = cache.get(key) or store.get(key)
+            if explanation is not None:
+                return explanation, None
+        if context is None:
+            # De préférence l'explication de la bonne réponse de l'autre question
+            keys = [
+                make_key(other["text"], other["choices"], i, other["answer"])
+                for i in [other["answer"], *range(1, len(other["choices"]) + 1)]
+            ]
+            found = store.get_many(keys)
+            context = next((found[k] for k in keys if k in found), None)
+    return None, context
+
+
+def _explain_new(question_text, choices, user_index, correct_index, priority=INTERACTIVE):
+    """Explication d'une réponse absente du cache : reprise d'un quasi-doublon, sinon Groq."""
+    explanation, context = _similar_explanation(question_text, choices, user_index, correct_index)
+    if explanation is not None:
+        return explanation
+    return _ask_groq(question_text, choices, user_index, correct_index, priority, context)
+
+
+def _compose_from_choice_explanations(question_text, choices, user_index, correct_index, priority):
+    """Explication composée localement à partir du JSON « toutes les réponses » de la question."""
+    canon = canonicalize(question_text, choices)
+    payload = choice_explanations.loads(_cached_explanation(
+        make_question_key(question_text, choices, correct_index),
+        canon.id,
+        lambda: _ask_groq_all_choices(question_text, choices, correct_index, priority),
+        priority,
+    ))
+    return choice_explanations.compose(
+        payload,
+        canon.choices,
+        canon.to_canonical(user_index),
+        canon.to_canonical(correct_index),
     )
 
-    return response.output_text.strip()
+
+def stream_ai_explanation(question_text, choices, user_index, correct_index):
+    """
+    Variante streaming de get_ai_explanation : générateur des morceaux de texte
+    au fur et à mesure de leur arrivée (pour st.write_stream).
+    Une explication déjà en cache est renvoyée d'un bloc. L'explication n'est
+    mise en cache qu'une fois le flux terminé : un flux interrompu (rerun)
+    ne laisse pas d'entrée à moitié écrite.
+    """
+    if not GROQ_API_KEY:
+        yield MISSING_KEY_MESSAGE
+        return
+    if EXPLANATION_BACKEND == "question":
+        # Le JSON ne se lit pas morceau par morceau : explication composée d'un bloc
+        yield get_ai_explanation(question_text, choices, user_index, correct_index)
+        return
+
+    key = make_key(question_text, choices, user_index, correct_index)
+    cache = _explanation_cache()
+    store = _explanation_store()
+
+    explanation = cache.get(key)
+    if explanation is None:
+        explanation = store.get(key)
+        if explanation is not None:
+            cache.put(key, explanation)
+    if explanation is not None:
+        yield explanation
+        return
+
+    _cache_miss.flag = True
+    qid = question_id(question_text, choices)
+    explanation, context = _similar_explanation(question_text, choices, user_index, correct_index)
+    if explanation is not None:
+        store.put(key, qid, explanation)
+        cache.put(key, explanation)
+        yield explanation
+        return
+
+    token = store.acquire_lease(key)
+    if token is None:
+        # Un autre réplica la génère déjà : on attend son résultat (délai borné)
+        explanation = store.wait_for(key, store.wait_timeout)
+        if explanation is not None:
+            cache.put(key, explanation)
+            yield explanation
+            return
+
+    parts = []
+    try:
+        for delta in _stream_groq(question_text, choices, user_index, correct_index, context):
+            parts.append(delta)
+            yield delta
+    except Exception as exc:
+        if not _unavailable(exc):
+            raise
+        # Explication incomplète : rien n'est mis en cache
+        if parts:
+            yield "\n\n" + BUSY_MESSAGE
+        else:
+            yield _degraded_explanation(question_text, choices, user_index, correct_index)
+        return
+    else:
+        # On n'arrive ici que si le flux est allé jusqu'au bout ; écrit avant de
+        # libérer le bail, pour que les réplicas en attente trouvent l'explication
+        explanation = "".join(parts).strip()
+        if explanation:
+            store.put(key, qid, explanation)
+            cache.put(key, explanation)
+    finally:
+        # Aussi si le flux est interrompu (rerun) : les autres réplicas prennent le relais
+        if token is not None:
+            store.release_lease(key, token)
+
+
+def get_batch_explanations(items):
+    """
+    Explications de plusieurs réponses (dicts avec les arguments de get_ai_explanation)
+    en une ou quelques requêtes Groq groupées. Les explications déjà connues viennent
+    du cache ; les nouvelles y sont ajoutées, une entrée par réponse.
+    """
+    if not GROQ_API_KEY:
+        return [MISSING_KEY_MESSAGE] * len(items)
+
+    cache = _explanation_cache()
+    store = _explanation_store()
+    keys = [make_key(**item) for item in items]
+    results = {}
+    for key in keys:
+        explanation = cache.get(key)
+        if explanation is not None:
+            results[key] = explanation
+    for key, explanation in store.get_many(k for k in keys if k not in results).items():
+        cache.put(key, explanation)
+        results[key] = explanation
+
+    missing = {}
+    for key, item in zip(keys, items):
+        if key in results or key in missing:
+            continue
+        explanation, _ = _similar_explanation(**item)
+        if explanation is None:
+            missing[key] = item
+            continue
+        store.put(key, question_id(item["question_text"], item["choices"]), explanation)
+        cache.put(key, explanation)
+        results[key] = explanation
+
+    for batch in batch_explanations.chunk(list(missing.values()), BATCH_MAX_ITEMS, BATCH_MAX_CHARS):
+        try:
+            explanations = _ask_groq_batch(batch)
+        except ValueError:
+            explanations = [None] * len(batch)
+        except Exception as exc:
+            if not _unavailable(exc):
+                raise
+            for item in batch:
+                results[make_key(**item)] = BUSY_MESSAGE
+            continue
+        for item, explanation in zip(batch, explanations):
+            key = make_key(**item)
+            if explanation is None:
+                # Réponse absente du lot : repli sur une requête individuelle
+                results[key] = get_ai_explanation(**item)
+                continue
+            store.put(key, question_id(item["question_text"], item["choices"]), explanation)
+            cache.put(key, explanation)
+            results[key] = explanation
+
+    return [results[key] for key in keys]
+
+
+def _build_prompt(question_text, choices, user_index, correct_index, context=None):
+    """
+    Partie variable du prompt d'explication (les consignes sont dans GROQ_INSTRUCTIONS).
+    La question est envoyée sous sa forme canonique pour que l'explication vaille
+    pour toutes ses permutations. `context` : explication d'une question proche.
+    """
+    canon = canonicalize(question_text, choices)
+    numbered = "\n".join(f"{i + 1}. {c}" for i, c in enumerate(canon.choices))
+    prompt = (
+        f"Question : {canon.text}\nChoix :\n{numbered}\n"
+        f"Réponse de l'élève : {canon.to_canonical(user_index)}\n"
+        f"Bonne réponse : {canon.to_canonical(correct_index)}"
+    )
+    if context:
+        prompt += f"\nExplication d'une question proche : {context}"
+    return prompt
+
+
+def _estimate_tokens(prompt, instructions, max_output_tokens):
+    """Tokens comptés d'avance pour une requête (≈ 3 caractères par token en français)."""
+    output_tokens = min(GROQ_OUTPUT_TOKENS_ESTIMATE, max_output_tokens)
+    return (len(prompt) + len(instructions)) // 3 + output_tokens
+
+
+def _create_response(
+    prompt,
+    route,
+    priority=INTERACTIVE,
+    instructions=GROQ_INSTRUCTIONS,
+    deadline=None,
+    hedge=True,
+    timed=True,
+    **kwargs,
+):
+    """
+    responses.create sur le modèle de `route`, en passant par l'ordonnanceur
+    global (débit, priorité, nouveaux essais) et le disjoncteur. Hors
+    pré-génération, l'appel est borné par `deadline` (GROQ_DEADLINE par défaut) ;
+    pour les explications interactives (et si `hedge`), une requête de secours
+    part si la première tarde plus que le p95 observé pour ce modèle. La réponse
+    est lue en streaming : la requête perdante ferme sa connexion (Groq arrête
+    la génération) et rend sa place dans l'ordonnanceur dès le morceau suivant.
+    Ce p95 (routage, délai de secours) ne mesure que les explications unitaires :
+    timed=False pour les appels groupés, bien plus longs. Les tokens réellement
+    consommés sont comptés (_usage_meter) et corrigent l'estimation faite par
+    l'ordonnanceur.
+    """
+    breaker = _circuit_breaker()
+    if not breaker.allow():
+        raise CircuitOpen("appels Groq suspendus après des échecs répétés")
+
+    router = _model_router()
+    kwargs.setdefault("max_output_tokens", route.max_output_tokens)
+    tokens = _estimate_tokens(prompt, instructions, kwargs["max_output_tokens"])
+    if deadline is None:
+        deadline = GROQ_DEADLINE
+    end = None if priority == BULK else time.monotonic() + deadline
+    sent = threading.Event()  # au moins une tentative est partie vers Groq
+
+    def request(cancelled):
+        if cancelled.is_set():
+            raise Cancelled("requête de secours inutile")
+        timeout = GROQ_READ_TIMEOUT if end is None else max(1.0, end - time.monotonic())
+        start = time.monotonic()
+        response = None
+        sent.set()
+        try:
+            stream = _groq_client().with_options(timeout=timeout).responses.create(
+                model=route.model,
+                instructions=instructions,
+                input=prompt,
+                stream=True,
+                **kwargs,
+            )
+            try:
+                for event in stream:
+                    if cancelled.is_set():
+                        raise Cancelled("une autre requête a répondu")
+                    if event.type == "response.completed":
+                        response = event.response
+                    elif event.type == "response.incomplete":
+                        # max_output_tokens atteint (raisonnement compris) : texte tronqué
+                        raise EmptyCompletion(f"{route.model} : réponse tronquée")
+            finally:
+                stream.close()
+            if response is None:
+                raise EmptyCompletion(route.model)  # flux interrompu ou response.failed
+        except Cancelled:
+            raise  # ni latence ni échec à compter pour le perdant
+        except Exception:
+            router.record(route.model, None, ok=False)
+            raise
+        router.record(route.model, time.monotonic() - start if timed else None, ok=True)
+        used = _usage_meter().record(route.model, getattr(response, "usage", None))
+        if used:
+            _scheduler().adjust_tokens(used - tokens)
+        return response
+
+    def scheduled(cancelled):
+        max_wait = None if end is None else max(0.0, end - time.monotonic())
+        return _scheduler().call(lambda: request(cancelled), priority=priority, tokens=tokens, max_wait=max_wait)
+
+    try:
+        if end is None:
+            response = scheduled(threading.Event())
+        else:
+            hedge_after = None
+            if hedge and priority == INTERACTIVE:
+                p95 = router.p95(route.model, default=GROQ_HEDGE_MAX_DELAY)
+                hedge_after = min(max(p95, GROQ_HEDGE_MIN_DELAY), GROQ_HEDGE_MAX_DELAY)
+            response = hedged_call(_hedge_executor(), scheduled, deadline, hedge_after)
+    except Overloaded:
+        breaker.release()  # saturation locale : rien à voir avec l'état de Groq
+        raise
+    except DeadlineExceeded:
+        if sent.is_set():
+            breaker.record_failure()
+        else:
+            breaker.release()  # délai passé dans la file de l'ordonnanceur, Groq pas appelé
+        raise
+    except Exception as exc:
+        if _is_retryable(exc):
+            breaker.record_failure()
+        else:
+            breaker.record_success()  # Groq a répondu, même si c'est une erreur
+        raise
+    breaker.record_success()
+    return response
+
+
+def _ask_groq(question_text, choices, user_index, correct_index, priority=INTERACTIVE, context=None):
+    """Appel Groq brut, sans cache, sur le modèle choisi par le routage."""
+    prompt = _build_prompt(question_text, choices, user_index, correct_index, context)
+    route = _model_router().choose(question_features(choices, user_index, correct_index, prompt))
+    response = _create_response(prompt, route, priority)
+
+    explanation = response.output_text.strip()
+    if not explanation:
+        # Une réponse vide mise en cache serait servie à tous les élèves suivants
+        raise EmptyCompletion(route.model)
+    return explanation
+
+
+def _ask_groq_all_choices(question_text, choices, correct_index, priority=INTERACTIVE):
+    """
+    Appel Groq brut « toutes les réponses » : renvoie le JSON validé et normalisé
+    (voir choice_explanations). Lève ValueError si la réponse est inutilisable.
+    """
+    canon = canonicalize(question_text, choices)
+    correct_index = canon.to_canonical(correct_index)
+    response = _create_response(
+        choice_explanations.build_prompt(canon.text, canon.choices, correct_index),
+        _model_router().choose(),
+        priority,
+        instructions=choice_explanations.INSTRUCTIONS,
+        deadline=GROQ_LONG_DEADLINE,
+        hedge=False,
+        timed=False,
+        text={"format": {"type": "json_object"}},
+    )
+    payload = choice_explanations.parse_payload(response.output_text, len(canon.choices), correct_index)
+    return choice_explanations.dumps(payload)
+
+
+def _ask_groq_batch(items):
+    """Appel Groq brut groupé : une explication (ou None) par élément, dans l'ordre."""
+    route = _model_router().choose()
+    response = _create_response(
+        batch_explanations.build_prompt(items),
+        route,
+        instructions=batch_explanations.INSTRUCTIONS,
+        deadline=GROQ_LONG_DEADLINE,
+        hedge=False,
+        timed=False,
+        text={"format": {"type": "json_object"}},
+        max_output_tokens=route.max_output_tokens * len(items),
+    )
+    return batch_explanations.parse_payload(response.output_text, len(items))
+
+
+def _stream_groq(question_text, choices, user_index, correct_index, context=None):
+    """
+    Appel Groq brut en streaming : génère les morceaux de texte reçus.
+    La place dans l'ordonnanceur est gardée jusqu'à la fin du flux.
+    """
+    breaker = _circuit_breaker()
+    if not breaker.allow():
+        raise CircuitOpen("appels Groq suspendus après des échecs répétés")
+
+    prompt = _build_prompt(question_text, choices, user_index, correct_index, context)
+    router = _model_router()
+    route = router.choose(question_features(choices, user_index, correct_index, prompt))
+    tokens = _estimate_tokens(prompt, GROQ_INSTRUCTIONS, route.max_output_tokens)
+    try:
+        with _scheduler().slot(INTERACTIVE, tokens):
+            start = time.monotonic()
+            try:
+                # Le délai s'applique à la connexion et à chaque attente de morceau
+                stream = _groq_client().with_options(timeout=GROQ_DEADLINE).responses.create(
+                    model=route.model,
+                    instructions=GROQ_INSTRUCTIONS,
+                    input=prompt,
+                    max_output_tokens=route.max_output_tokens,
+                    stream=True,
+                )
+            except Exception as exc:
+                router.record(route.model, None, ok=False)
+                if _is_retryable(exc):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+                raise
+            router.record(route.model, None, ok=True)
+            breaker.record_success()
+            first = True
+            completed = False
+            try:
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        if first:
+                            _usage_meter().record_first_token(route.model, time.monotonic() - start)
+                            first = False
+                        yield event.delta
+                    elif event.type == "response.completed":
+                        completed = True
+                        used = _usage_meter().record(route.model, getattr(event.response, "usage", None))
+                        if used:
+                            _scheduler().adjust_tokens(used - tokens)
+                if not completed:
+                    # response.incomplete (max_output_tokens) ou flux coupé : rien ne sera mis en cache
+                    raise EmptyCompletion(f"{route.model} : réponse tronquée")
+            finally:
+                # Rerun pendant le flux : on ferme la connexion HTTP au lieu de la laisser pendre
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+    except Overloaded:
+        # Place refusée par l'ordonnanceur : sans release, la requête d'essai du
+        # demi-ouvert ne se terminerait jamais et le disjoncteur resterait bloqué
+        breaker.release()
+        raise
 
 
 # ================== BANQUE DE QUESTIONS ==================
-questions = [
-    # ===================== Cours 1 =====================
-    {
-        "course": 1,
-        "text": "Pour décaler le niveau de Fermi vers la bande de valence,",
-        "choices": [
-            "il faut doper P",
-            "il faut chauffer le matériau",
-            "il faut doper N",
-            "il faut apporter des atomes donneurs",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "La masse effective d'un électron",
-        "choices": [
-            "est inversement proportionnelle à la courbure des bandes d'énergie",
-            "est la masse de l'électron au repos",
-            "est proportionnelle à la dérivée des bandes d'énergie",
-            "est inversement proportionnelle à la dérivée des bandes d'énergie",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "Le niveau de Fermi",
-        "choices": [
-            "détermine le peuplement des bandes d'énergie",
-            "annule la fonction d'onde",
-            "est un niveau de tension",
-            "annule la fonction de Fermi-Dirac",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "Le dopage d'un semi-conducteur par des atomes accepteurs",
-        "choices": [
-            "est un dopage de type NP",
-            "est un dopage de type PN",
-            "est un dopage de type P",
-            "constitue une jonction PN",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 1,
-        "text": "Le niveau de Fermi d'un semi-conducteur intrinsèque est",
-        "choices": [
-            "dans la bande de valence",
-            "entre les vallées L et X",
-            "dans la bande de conduction",
-            "approximativement au milieu de la bande interdite",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 1,
-        "text": "Un trou est un manque",
-        "choices": [
-            "d'ion positif",
-            "d'électron",
-            "d'ion négatif",
-            "d'atome",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 1,
-        "text": 'Un matériau isolant a un "grand" gap.',
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "Les matériaux à gap direct sont adaptés à la fabrication de composants opto-électroniques.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "À faible champ électrique, la mobilité est le coefficient de proportionnalité "
-                "entre la vitesse des porteurs de charges mobiles et le champ électrique.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "Les électrons ont tendance à remplir d'abord les niveaux d'énergie de plus haute énergie.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 1,
-        "text": "La position du niveau de Fermi dans la bande interdite détermine le peuplement "
-                "en électrons de la bande de conduction.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 1,
-        "text": "Un semi-conducteur extrinsèque est un semi-conducteur dans lequel ont été introduits "
-                "des atomes d'impuretés.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-
-    # ===================== Cours 2 =====================
-    {
-        "course": 2,
-        "text": "Les contacts ohmiques d'une diode sont",
-        "choices": [
-            "des dépôts métalliques de part et d'autre du composant.",
-            "des pointes de mesures.",
-            "une résistance de protection en parallèle avec la diode.",
-            "des résistances de protection en série avec la diode.",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 2,
-        "text": "Pour décaler le niveau de Fermi vers la bande de valence,",
-        "choices": [
-            "il faut doper P",
-            "il faut apporter des atomes donneurs",
-            "il faut chauffer le matériau",
-            "il faut doper N",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 2,
-        "text": "Lors du tracé du diagramme des bandes d'une jonction PN, il faut",
-        "choices": [
-            "aligner les niveaux E₀ des deux côtés",
-            "aligner les niveaux Ev des deux côtés",
-            "aligner les niveaux de Fermi des deux côtés",
-            "aligner les niveaux Ec des deux côtés",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 2,
-        "text": "Lorsqu'une jonction PN est polarisée en direct,",
-        "choices": [
-            "les électrons restent confinés dans la région dopée N.",
-            "la barrière de potentiel interne diminue.",
-            "les trous restent confinés dans la région dopée P.",
-            "la barrière d'énergie interne augmente.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 2,
-        "text": "Le dopage d'un semi-conducteur par des atomes accepteurs",
-        "choices": [
-            "est un dopage de type P",
-            "est un dopage de type PN",
-            "est un dopage de type NP",
-            "constitue une jonction PN",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 2,
-        "text": "Dans une jonction PN à l'équilibre, le champ électrique est maximal "
-                "(en valeur absolue) au niveau de la jonction.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 2,
-        "text": "Lorsqu'une diode est polarisée en inverse, le courant est rigoureusement nul.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 2,
-        "text": "Les électrons ont tendance à remplir d'abord les niveaux d'énergie de plus haute énergie.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 2,
-        "text": "La position du niveau de Fermi dans la bande interdite détermine le peuplement "
-                "en électrons de la bande de conduction.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 2,
-        "text": "Un semi-conducteur extrinsèque est un semi-conducteur dans lequel ont été introduits "
-                "des atomes d'impuretés.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-
-    # ===================== Cours 3 =====================
-    {
-        "course": 3,
-        "text": "La loi donnant la caractéristique statique de la jonction PN est connue sous le nom de :",
-        "choices": [
-            "loi de Moore.",
-            "loi de Kilby.",
-            "loi de Shockley.",
-            "loi de Boltzmann.",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 3,
-        "text": "Les contacts ohmiques d'une diode sont",
-        "choices": [
-            "des résistances de protection en série avec la diode.",
-            "une résistance de protection en parallèle avec la diode.",
-            "des dépôts métalliques de part et d'autre du composant.",
-            "des pointes de mesures.",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 3,
-        "text": "Pour une jonction N+P, l'efficacité d'injection est définie par la relation",
-        "choices": [
-            "Jn/Jp",
-            "Jp/Jn",
-            "(Jp+Jn)/Jn",
-            "(Jp+Jn)/Jp",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 3,
-        "text": "Lorsqu'une jonction PN est polarisée en direct,",
-        "choices": [
-            "les électrons restent confinés dans la région dopée N.",
-            "la barrière de potentiel interne diminue.",
-            "les trous restent confinés dans la région dopée P.",
-            "la barrière d'énergie interne augmente.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 3,
-        "text": "Dans une jonction PN, le phénomène d'avalanche se produit",
-        "choices": [
-            "lorsque la tension de polarisation est nulle.",
-            "lorsqu'il fait très froid.",
-            "lorsque la tension de polarisation en direct est importante.",
-            "lorsque la tension de polarisation en inverse est importante.",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 3,
-        "text": "Lorsque l'on applique une tension Va = 0,6 V sur les contacts ohmiques, "
-                "une jonction PN de tension de diffusion 0,8 V voit une tension de",
-        "choices": [
-            "0,6 V",
-            "0,8 V",
-            "1,4 V",
-            "0,2 V",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 3,
-        "text": "Dans une jonction PN à l'équilibre, le champ électrique est maximal "
-                "(en valeur absolue) au niveau de la jonction.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 3,
-        "text": "Lorsqu'une diode est polarisée en inverse, le courant est rigoureusement nul.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-
-    # ===================== Cours 4 =====================
-    {
-        "course": 4,
-        "text": "Le gain en courant d'un transistor bipolaire correspond approximativement à",
-        "choices": [
-            "l'efficacité d'injection de la jonction base-émetteur.",
-            "l'efficacité d'injection des porteurs fixes.",
-            "l'efficacité d'injection de la jonction base-collecteur.",
-            "l'efficacité d'injection de la jonction émetteur-collecteur.",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 4,
-        "text": "Le modèle petit signal d'un transistor bipolaire est valable si",
-        "choices": [
-            "vbe >> Vt",
-            "vbe << Vt",
-            "Vt = 26 mV",
-            "Vt << 26 mV",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 4,
-        "text": "Les jonctions base-émetteur et base-collecteur sont polarisées en direct. "
-                "Le transistor est donc en mode",
-        "choices": [
-            "normal.",
-            "saturé.",
-            "bloqué.",
-            "inverse.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 4,
-        "text": "Lorsqu'un transistor bipolaire est polarisé en mode normal,",
-        "choices": [
-            "la jonction BE est passante et la jonction BC est bloquée.",
-            "la jonction BE est passante et la jonction BC est passante.",
-            "la jonction BE est bloquée et la jonction BC est passante.",
-            "la jonction BE est bloquée et la jonction BC est bloquée.",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 4,
-        "text": "Lors du blocage d'une jonction PN, le courant s'éteint instantanément.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 4,
-        "text": "Dans une jonction PN en régime dynamique, les variations de charges stockées "
-                "peuvent être modélisées par une capacité.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 4,
-        "text": "La résistance dynamique d'une diode est d'autant plus élevée que le courant "
-                "de polarisation est élevé.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 4,
-        "text": "La structure d'un transistor bipolaire est symétrique.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 4,
-        "text": "Pour une structure donnée, un transistor PNP est plus rapide qu'un transistor NPN.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-
-    # ===================== Cours 5 =====================
-    {
-        "course": 5,
-        "text": "Dans la jonction base-émetteur d'un TBH,",
-        "choices": [
-            "la barrière d'énergie vue par les trous de l'émetteur est inférieure à "
-            "celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les électrons de l'émetteur est inférieure à "
-            "celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les électrons de l'émetteur est supérieure à "
-            "celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les électrons de l'émetteur est identique à "
-            "celle vue par les trous de la base.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 5,
-        "text": "Les contacts ohmiques d'une diode sont",
-        "choices": [
-            "des pointes de mesures.",
-            "des résistances de protection en série avec la diode.",
-            "une résistance de protection en parallèle avec la diode.",
-            "des dépôts métalliques de part et d'autre du composant.",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 5,
-        "text": "L'hétérojonction base-collecteur d'un TBDH est utile pour",
-        "choices": [
-            "améliorer le gain en courant du transistor sans perdre en rapidité.",
-            "améliorer l'efficacité d'injection du transistor sans perdre en rapidité.",
-            "améliorer le champ de claquage du transistor sans perdre en rapidité.",
-            "améliorer la tenue en tension du transistor sans perdre en rapidité.",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 5,
-        "text": "Dans un transistor bipolaire à hétérojonction,",
-        "choices": [
-            "il n'y a pas d'effet Early.",
-            "la jonction base-émetteur est bloquée.",
-            "le gain en tension est très faible.",
-            "le courant de collecteur est très faible.",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 5,
-        "text": "La base d'un TBH est fabriquée dans un matériau à plus grand gap "
-                "que celui de l'émetteur.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 5,
-        "text": "Dans un TBH, la résistance d'Early est quasi-nulle.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-
-    # ===================== Cours 6 =====================
-    {
-        "course": 6,
-        "text": "La barrière Schottky s'oppose au passage des électrons du métal vers le "
-                "semi-conducteur. Elle est due à la différence",
-        "choices": [
-            "entre les affinités électroniques des deux semi-conducteurs.",
-            "entre l'affinité électronique du métal et l'affinité électronique du semi-conducteur.",
-            "entre le travail d'extraction du métal et l'affinité électronique du semi-conducteur.",
-            "entre le travail d'extraction du semi-conducteur et l'affinité électronique du métal.",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 6,
-        "text": "Le courant en polarisation inverse d'une diode Schottky est dû",
-        "choices": [
-            "au courant de trous provenant du métal.",
-            "à l'effet d'avalanche.",
-            "aux effets thermiques.",
-            "à l'effet tunnel.",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 6,
-        "text": "Une diode Schottky a une meilleure tenue en tension inverse qu'une diode PN "
-                "aux dimensions équivalentes.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 6,
-        "text": "Le MeSFET est un transistor rapide car sa grille est constituée d'une jonction Schottky.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 6,
-        "text": "Dans la jonction base-émetteur d'un TBH,",
-        "choices": [
-            "la barrière d'énergie vue par les électrons de l'émetteur est identique "
-            "à celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les électrons de l'émetteur est supérieure "
-            "à celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les électrons de l'émetteur est inférieure "
-            "à celle vue par les trous de la base.",
-            "la barrière d'énergie vue par les trous de l'émetteur est inférieure "
-            "à celle vue par les trous de la base.",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 6,
-        "text": "L'hétérojonction base-collecteur d'un TBDH est utile pour",
-        "choices": [
-            "améliorer la tenue en tension du transistor sans perdre en rapidité.",
-            "améliorer l'efficacité d'injection du transistor sans perdre en rapidité.",
-            "améliorer le champ de claquage du transistor sans perdre en rapidité.",
-            "améliorer le gain en courant du transistor sans perdre en rapidité.",
-        ],
-        "answer": 1,
-    },
-
-    # ===================== Cours 7 =====================
-    {
-        "course": 7,
-        "text": "Le canal d'un HEMT est",
-        "choices": [
-            "fortement dopé P.",
-            "non dopé.",
-            "autant dopé que la couche barrière.",
-            "fortement dopé N.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 7,
-        "text": "À faible tension VDS, un transistor à effet de champ",
-        "choices": [
-            "est en régime inverse.",
-            "est en régime normal.",
-            "est en régime de saturation.",
-            "est en régime ohmique.",
-        ],
-        "answer": 4,
-    },
-    {
-        "course": 7,
-        "text": "Le transistor HEMT est",
-        "choices": [
-            "un transistor à grille isolée du canal.",
-            "un composant bipolaire.",
-            "un transistor unipolaire rapide.",
-            "un transistor de puissance.",
-        ],
-        "answer": 3,
-    },
-    {
-        "course": 7,
-        "text": "L'hétérojonction base-collecteur d'un TBH permet d'augmenter la rapidité du transistor "
-                "sans perte de gain en courant.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 7,
-        "text": "La mobilité électronique est d'autant plus élevée que le dopage est important.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 2,
-    },
-    {
-        "course": 7,
-        "text": "La transconductance d'un FET donne les variations du courant de sortie "
-                "par rapport à la tension d'entrée.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-
-    # ===================== Cours 8 =====================
-    {
-        "course": 8,
-        "text": "En introduisant des contraintes mécaniques dans le canal de conduction d'un mosfet,",
-        "choices": [
-            "on peut améliorer la mobilité électronique dans le canal.",
-            "on améliore la tenue en tension du transistor.",
-            "on peut réduire les courants de fuite.",
-            "on peut améliorer la densité d'intégration.",
-        ],
-        "answer": 1,
-    },
-    {
-        "course": 8,
-        "text": "Le mosfet a la particularité",
-        "choices": [
-            "d'amplifier le courant d'entrée.",
-            "d'avoir la grille isolée électriquement du canal.",
-            "d'être nécessairement un composant de puissance.",
-            "d'être un composant bipolaire.",
-        ],
-        "answer": 2,
-    },
-    {
-        "course": 8,
-        "text": "La fréquence de transition d'un transistor à effet de champ dépend de sa transconductance.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 8,
-        "text": 'L\'épaisseur du "spacer" d\'un HEMT a une influence sur le courant dans le canal.',
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-    {
-        "course": 8,
-        "text": "Le silicium est un matériau piézo-résistif.",
-        "choices": ["Vrai", "Faux"],
-        "answer": 1,
-    },
-]
+@st.cache_resource(show_spinner=False)
+def _bank_loader():
+    """Banque chargée une fois par processus, relue quand le fichier change."""
+    return BankLoader(QUESTION_BANK_PATH, check_interval=QUESTION_BANK_CHECK_INTERVAL)
+
+
+def _question_bank():
+    """
+    Version courante de la banque, commune à toutes les sessions (immuable).
+    Une partie en cours garde la version avec laquelle elle a commencé
+    (st.session_state.bank) ; la suivante prend la nouvelle.
+    """
+    return _bank_loader().get()
 
 
 # ================== FONCTIONS UTILITAIRES ==================
-def reset_quiz(selected_course):
-    """Initialise ou réinitialise le quiz dans st.session_state."""
-    if selected_course == "Tous":
-        qs = questions.copy()
+# Clés des boutons radio de réponse, une par question (voir main)
+_ANSWER_KEY = re.compile(r"q_\d+_answer")
+
+
+def _get_bit(bits, i):
+    return bits[i >> 3] >> (i & 7) & 1
+
+
+def _set_bit(bits, i):
+    bits[i >> 3] |= 1 << (i & 7)
+
+
+def _score():
+    return sum(byte.bit_count() for byte in st.session_state.correct)
+
+
+def _answer_request(bank_index, user_index):
+    """Arguments de get_ai_explanation pour la réponse `user_index` à la question `bank_index`."""
+    question = st.session_state.bank[bank_index]
+    return {
+        "question_text": question["text"],
+        "choices": question["choices"],
+        "user_index": user_index,
+        "correct_index": question["answer"],
+    }
+
+
+def _spaced_schedule(bank, course):
+    """Ordre de révision espacée de l'élève sur les questions du cours (None : toute la banque)."""
+    states = _learner_store().load(_learner_id())
+    positions, seen = [], set()
+    for p in bank.positions(course):
+        # Une question présente dans plusieurs cours n'est révisée qu'une fois
+        if bank.ids[p] not in seen:
+            seen.add(bank.ids[p])
+            positions.append(p)
+    return LeitnerSchedule(
+        positions,
+        {p: states[bank.ids[p]] for p in positions if bank.ids[p] in states},
+        _answer_statistics().difficulty(bank.ids),
+        time.time(),
+    )
+
+
+def reset_quiz(selected_course, length=None, avoid_recent=False, favor_difficult=False, spaced=False):
+    """
+    Initialise ou réinitialise le quiz dans st.session_state : `length` questions
+    (None : toutes) du cours choisi, en évitant si possible celles vues récemment,
+    et en tirant plus souvent les questions les plus ratées si `favor_difficult`.
+    En révision espacée (`spaced`), chaque question est choisie après la réponse
+    à la précédente, selon la progression de l'élève.
+    L'état d'une session reste compact quelle que soit la taille des questions :
+    ordre de passage (positions dans la banque partagée), bits « répondue » /
+    « juste », et réponses sous forme de couples (position, choix).
+    """
+    bank = _question_bank()
+    recent = st.session_state.get("recent")
+    if recent is None:
+        recent = st.session_state.recent = deque(maxlen=RECENT_QUESTIONS)
+    old_bank = st.session_state.get("bank")
+    if old_bank is not None and old_bank is not bank:
+        # Banque rechargée : positions retrouvées par identifiant de question
+        positions = (bank.position(old_bank.ids[p]) for p in recent)
+        recent = st.session_state.recent = deque(
+            (p for p in positions if p is not None), maxlen=RECENT_QUESTIONS
+        )
+
+    course = None if selected_course == "Tous" else selected_course
+    schedule = None
+    if spaced:
+        schedule = _spaced_schedule(bank, course)
+        # Positions remplies au fur et à mesure (voir _submit_answer)
+        order = [0] * min(length or len(schedule), len(schedule))
+        if order:
+            order[0] = schedule.pop()
     else:
-        qs = [q for q in questions if q["course"] == selected_course]
+        order = sample_positions(
+            bank,
+            length,
+            course,
+            avoid=set(recent) if avoid_recent else frozenset(),
+            weights=(
+                QUIZ_DIFFICULTY_FLOOR + _answer_statistics().difficulty(bank.ids)
+                if favor_difficult else None
+            ),
+        )
+
+    _start_quiz(bank, array("H" if len(bank) <= 0xFFFF else "I", order), schedule, selected_course)
+    _save_session()
+
 
-    random.shuffle(qs)
+def _start_quiz(bank, order, schedule=None, schedule_course=None):
+    """État d'une nouvelle partie dans st.session_state (voir reset_quiz)."""
+    # Les réponses de la partie précédente ne servent plus
+    for key in [k for k in st.session_state if _ANSWER_KEY.fullmatch(k)]:
+        del st.session_state[key]
 
-    st.session_state.questions_selection = qs
+    st.session_state.bank = bank
+    st.session_state.order = order
+    st.session_state.answered = bytearray((len(order) + 7) // 8)
+    st.session_state.correct = bytearray((len(order) + 7) // 8)
     st.session_state.current_index = 0
-    st.session_state.score = 0
     st.session_state.completed = False
     st.session_state.last_feedback = ""
-    st.session_state.last_correct_answer = ""
+    st.session_state.last_answer = None
     st.session_state.last_explanation = ""
+    st.session_state.explanation_future = None
+    st.session_state.explanation_request = None
+    st.session_state.prefetched_index = None
+    st.session_state.deferred_answers = []
+    st.session_state.review = None
+    st.session_state.shown_index = None
+    st.session_state.schedule = schedule
+    # Cours de la révision espacée, pour reconstruire son tas à la reprise
+    st.session_state.schedule_course = schedule_course if schedule is not None else None
+
+
+def _encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _save_session():
+    """
+    Enregistre (en différé, voir session_store) la partie sous le jeton de reprise :
+    positions et bits de la session, dernier feedback, et clé de l'explication
+    plutôt que son texte.
+    """
+    token = st.session_state.get("resume_token")
+    if token is None:
+        return
+    last_answer = st.session_state.last_answer
+    _session_store().save(token, {
+        "bank": st.session_state.bank.version,
+        "typecode": st.session_state.order.typecode,
+        "order": _encode(st.session_state.order.tobytes()),
+        "answered": _encode(st.session_state.answered),
+        "correct": _encode(st.session_state.correct),
+        "index": st.session_state.current_index,
+        "completed": st.session_state.completed,
+        "feedback": st.session_state.last_feedback,
+        "last_answer": last_answer,
+        "explanation": make_key(**_answer_request(*last_answer)) if last_answer else None,
+        "deferred": list(st.session_state.deferred_answers),
+        "spaced": st.session_state.schedule_course,
+    })
+
+
+def _restore_session(token):
+    """
+    Reprend la partie enregistrée sous `token` (une lecture). Renvoie False si elle
+    est introuvable ou si la banque a changé depuis (positions plus valables).
+    """
+    saved = _session_store().load(token)
+    bank = _question_bank()
+    if saved is None or saved["bank"] != bank.version:
+        return False
+    order = array(saved["typecode"], base64.b64decode(saved["order"]))
+    index = saved["index"]
+
+    schedule = None
+    if saved["spaced"] is not None:
+        schedule = _spaced_schedule(bank, None if saved["spaced"] == "Tous" else saved["spaced"])
+        if index < len(order):
+            # Question affichée : déjà sortie du tas avant la coupure
+            schedule.take(order[index])
+    _start_quiz(bank, order, schedule, saved["spaced"])
+    st.session_state.answered = bytearray(base64.b64decode(saved["answered"]))
+    st.session_state.correct = bytearray(base64.b64decode(saved["correct"]))
+    st.session_state.current_index = index
+    st.session_state.completed = saved["completed"]
+    st.session_state.last_feedback = saved["feedback"]
+    st.session_state.last_answer = tuple(saved["last_answer"]) if saved["last_answer"] else None
+    st.session_state.deferred_answers = [tuple(answer) for answer in saved["deferred"]]
+    st.session_state.recent = deque(order[:index], maxlen=RECENT_QUESTIONS)
+    if saved["explanation"]:
+        # Explication déjà payée : relue dans les caches, jamais redemandée à Groq
+        key = saved["explanation"]
+        st.session_state.last_explanation = (
+            _explanation_cache().get(key) or _explanation_store().get(key) or ""
+        )
+    return True
+
+
+def _collect_explanation():
+    """
+    Récupère l'explication calculée en arrière-plan si elle est prête.
+    Renvoie True tant qu'elle est encore en cours de calcul.
+    """
+    future = st.session_state.get("explanation_future")
+    if future is None:
+        return False
+    if not future.done():
+        return True
+    st.session_state.explanation_future = None
+    try:
+        st.session_state.last_explanation = future.result()
+    except Exception as exc:
+        st.session_state.last_explanation = f"L'explication n'a pas pu être générée ({exc})."
+    return False
+
+
+@st.fragment(run_every=EXPLANATION_POLL_INTERVAL)
+def _pending_explanation():
+    """Attend l'explication en arrière-plan sans bloquer le reste de la page."""
+    if _collect_explanation():
+        with st.expander("📚 Explication par l'IA"):
+            st.caption("L'IA prépare une explication...")
+    else:
+        # Explication prête : un dernier rerun l'affiche et arrête le polling
+        st.rerun()
+
+
+def _stream_explanation(slot):
+    """Écrit en streaming, dans `slot`, l'explication demandée à la dernière validation."""
+    request = st.session_state.get("explanation_request")
+    if slot is None or request is None:
+        return
+    with slot.expander("📚 Explication par l'IA", expanded=True):
+        explanation, latency, hit = _timed_explanation(
+            st.write_stream, stream_ai_explanation(**_answer_request(*request))
+        )
+    st.session_state.last_explanation = explanation
+    st.session_state.explanation_request = None
+    event, st.session_state.pending_event = st.session_state.pending_event, None
+    if event is not None:
+        _answer_log().append(event._replace(explanation_latency=latency, cache_hit=hit))
+
+
+def _log_pending_answer():
+    """Journalise sans latence la réponse dont l'explication en streaming a été interrompue."""
+    event = st.session_state.get("pending_event")
+    if event is not None:
+        st.session_state.pending_event = None
+        _answer_log().append(event)
+
+
+def _explain_and_log(event, request):
+    """get_ai_explanation, puis journalisation de la réponse avec la latence de l'explication."""
+    try:
+        explanation, latency, hit = _timed_explanation(get_ai_explanation, **request)
+    except Exception:
+        _answer_log().append(event)
+        raise
+    _answer_log().append(event._replace(explanation_latency=latency, cache_hit=hit))
+    return explanation
+
+
+def _review_deferred_answers():
+    """Mode « en fin de quiz » : explique toutes les erreurs avec des requêtes groupées."""
+    answers = [_answer_request(*answer) for answer in st.session_state.deferred_answers]
+    if st.session_state.review is None:
+        with st.spinner("L'IA prépare la revue de tes erreurs..."):
+            st.session_state.review = get_batch_explanations(answers)
+
+    st.subheader("📚 Revue de tes erreurs")
+    for item, explanation in zip(answers, st.session_state.review):
+        with st.expander(item["question_text"]):
+            st.error(f"Ta réponse : {item['choices'][item['user_index'] - 1]}")
+            st.info(f"Bonne réponse : {item['choices'][item['correct_index'] - 1]}")
+            st.write(explanation)
+
+
+def _prefetch_explanations(question):
+    """
+    Lance en tâche de fond les explications probables de la question affichée :
+    la bonne réponse et les mauvaises réponses les plus choisies jusqu'ici.
+    """
+    if not GROQ_API_KEY:
+        return
+    canon = canonicalize(question["text"], question["choices"])
+    correct = canon.to_canonical(question["answer"])
+    wrong = [c for c in range(1, len(canon.choices) + 1) if c != correct]
+    if len(wrong) > 1:
+        # Historique du journal, à défaut les réponses vues depuis le démarrage
+        counts = _answer_statistics().choice_counts(canon.id) or _answer_stats().counts(canon.id)
+        wrong = sorted((c for c in wrong if counts.get(c)), key=lambda c: -counts[c])
+
+    cache = _explanation_cache()
+    for c in [correct] + wrong[:PREFETCH_WRONG_ANSWERS]:
+        user_index = canon.from_canonical(c)
+        key = make_key(question["text"], question["choices"], user_index, question["answer"])
+        if cache.get(key) is None:
+            _prefetcher().submit(
+                st.session_state.prefetch_owner,
+                key,
+                get_ai_explanation,
+                question["text"],
+                question["choices"],
+                user_index,
+                question["answer"],
+                priority=PREFETCH,
+            )
+
+
+def _submit_answer(bank_index, idx):
+    """Valide la réponse à la question n° `idx` du quiz (rappel du bouton du formulaire)."""
+    # Une question déjà répondue (ex. double clic) n'est pas comptée deux fois
+    if _get_bit(st.session_state.answered, idx):
+        return
+    _log_pending_answer()
+    question = st.session_state.bank[bank_index]
+    choix = st.session_state[f"q_{idx}_answer"]
+    bonne_reponse_index = question["answer"]
+
+    canon = canonicalize(question["text"], question["choices"])
+    _answer_stats().record(canon.id, canon.to_canonical(choix))
+    # L'élève passe à la suite : ses pré-chargements pas encore démarrés sont inutiles
+    _prefetcher().cancel(st.session_state.prefetch_owner)
+
+    _set_bit(st.session_state.answered, idx)
+    if choix == bonne_reponse_index:
+        _set_bit(st.session_state.correct, idx)
+        st.session_state.last_feedback = "✅ Bonne réponse !"
+    else:
+        st.session_state.last_feedback = "❌ Mauvaise réponse."
+    st.session_state.last_answer = (bank_index, choix)
+    st.session_state.answers += 1
+    st.session_state.recent.append(bank_index)
+    schedule = st.session_state.schedule
+    if schedule is not None:
+        # Révision espacée : nouvelle échéance de la question, choix de la suivante
+        store, learner, now = _learner_store(), _learner_id(), time.time()
+        state = store.load_one(learner, canon.id)
+        state = next_review(state, choix == bonne_reponse_index, now)
+        store.save(learner, canon.id, state)
+        schedule.reschedule(bank_index, state.due)
+        if idx + 1 < len(st.session_state.order):
+            st.session_state.order[idx + 1] = schedule.pop()
+    # Le bouton radio de cette question ne sera plus affiché
+    del st.session_state[f"q_{idx}_answer"]
+
+    # Explication IA (Groq) ; la réponse est journalisée une fois la latence
+    # de son explication connue
+    request = (bank_index, choix)
+    mode_explication = st.session_state.explanation_mode
+    event = AnswerEvent(
+        timestamp=time.time(),
+        session=st.session_state.prefetch_owner,
+        question_id=canon.id,
+        course=question["course"],
+        choice=canon.to_canonical(choix),
+        correct=choix == bonne_reponse_index,
+        answer_time=(
+            time.monotonic() - st.session_state.shown_at
+            if st.session_state.shown_index == idx else None
+        ),
+        mode=mode_explication,
+    )
+    st.session_state.last_explanation = ""
+    st.session_state.explanation_future = None
+    st.session_state.explanation_request = None
+    if mode_explication == "Streaming":
+        # Écrite en streaming au prochain affichage, sous forme de morceaux
+        st.session_state.explanation_request = request
+        st.session_state.pending_event = event
+    elif mode_explication == "En arrière-plan":
+        # Calculée pendant que l'élève lit déjà la question suivante
+        st.session_state.explanation_future = _explanation_executor().submit(
+            _explain_and_log, event, _answer_request(*request)
+        )
+    elif mode_explication == "En fin de quiz":
+        # Les erreurs seront expliquées d'un coup sur l'écran de fin
+        if choix != bonne_reponse_index:
+            st.session_state.deferred_answers.append(request)
+        _answer_log().append(event)
+    else:
+        with st.spinner("L'IA prépare une explication..."):
+            st.session_state.last_explanation = _explain_and_log(event, _answer_request(*request))
+
+    # Passer à la question suivante
+    st.session_state.current_index += 1
+    if st.session_state.current_index >= len(st.session_state.order):
+        st.session_state.completed = True
+    _save_session()
 
 
 def main():
@@ -674,38 +1364,114 @@ def main():
     )
 
     # === Initialisation de l'état ===
+    # Premier passage dans le processus : crée le client et préchauffe ses connexions
+    if GROQ_API_KEY and GROQ_WARMUP_CONNECTIONS > 0:
+        _groq_client()
+
     if "initialized" not in st.session_state:
         st.session_state.initialized = True
-        reset_quiz("Tous")
+        # Identifiant de la session : ses pré-chargements, ses lignes du journal des réponses
+        st.session_state.prefetch_owner = uuid.uuid4().hex
+        st.session_state.pending_event = None
+        st.session_state.runs = 0
+        st.session_state.answers = 0
+        # Page rechargée ou connexion perdue : la partie reprend là où elle en était
+        token = st.query_params.get("reprise")
+        if token and _restore_session(token):
+            st.session_state.resume_token = token
+        else:
+            st.session_state.resume_token = st.query_params["reprise"] = token or uuid.uuid4().hex
+            reset_quiz("Tous")
+    # Exécutions complètes seulement : les fragments ne repassent pas par ici
+    st.session_state.runs += 1
 
     # === Barre latérale : paramètres ===
     st.sidebar.header("Paramètres du quiz")
     choix_cours = st.sidebar.selectbox(
         "Cours à réviser",
-        options=["Tous", 1, 2, 3, 4, 5, 6, 7, 8],
+        options=["Tous", *_question_bank().courses],
         help="Choisis un numéro de cours ou 'Tous' pour mélanger.",
     )
 
+    longueur = st.sidebar.selectbox(
+        "Nombre de questions",
+        options=QUIZ_LENGTHS,
+        index=len(QUIZ_LENGTHS) - 1,
+        format_func=lambda n: "Toutes" if n is None else str(n),
+        help="Avec 'Tous', les questions sont prises dans chaque cours en proportion de sa taille.",
+    )
+
+    eviter_vues = st.sidebar.toggle(
+        "Éviter les questions déjà vues",
+        value=True,
+        help="Tant que possible, ne repose pas les questions de tes dernières parties.",
+    )
+
+    st.sidebar.selectbox(
+        "Explications IA",
+        options=EXPLANATION_MODES,
+        key="explanation_mode",
+        help="« En arrière-plan » : la question suivante s'affiche tout de suite, "
+             "l'explication de ta réponse arrive dès qu'elle est prête.",
+    )
+
+    prefetch = st.sidebar.toggle(
+        "Pré-charger les explications",
+        key="prefetch",
+        help="Prépare les explications probables pendant que tu lis la question.",
+    )
+
+    difficiles = st.sidebar.toggle(
+        "Insister sur les questions difficiles",
+        help="Tire plus souvent les questions que les élèves ratent le plus.",
+    )
+
+    espacee = st.sidebar.toggle(
+        "Révision espacée",
+        help="Revois surtout les questions que tu ne maîtrises pas encore : une question "
+             "réussie revient de plus en plus tard. Ta progression est liée à l'adresse "
+             "de cette page (paramètre « eleve »), garde-la pour la retrouver.",
+    )
+
     if st.sidebar.button("🔁 (Re)commencer le quiz"):
-        reset_quiz(choix_cours)
+        reset_quiz(choix_cours, longueur, eviter_vues, difficiles, espacee)
+
+    if SHOW_STATS:
+        with st.sidebar.expander("Statistiques"):
+            runs, answers = st.session_state.runs, st.session_state.answers
+            st.caption(
+                f"Exécutions du script : {runs} pour {answers} réponse(s)"
+                + (f", soit {runs / answers:.1f} par réponse" if answers else "")
+            )
+            st.json(_usage_meter().snapshot())
+            st.caption("Journal des réponses")
+            st.json(_answer_log().stats())
+            st.dataframe(_answer_statistics().course_table(), hide_index=True)
 
     # === Feedback de la question précédente ===
+    # En mode streaming, l'explication est écrite ici une fois la question suivante affichée
+    explanation_slot = None
     if st.session_state.last_feedback:
         if "✅" in st.session_state.last_feedback:
             st.success(st.session_state.last_feedback)
         else:
             st.error(st.session_state.last_feedback)
-            if st.session_state.last_correct_answer:
-                st.info(f"Bonne réponse : {st.session_state.last_correct_answer}")
+            if st.session_state.last_answer:
+                last = st.session_state.bank[st.session_state.last_answer[0]]
+                st.info(f"Bonne réponse : {last['answer']}. {last['choices'][last['answer'] - 1]}")
 
-        if st.session_state.get("last_explanation"):
+        if st.session_state.get("explanation_request"):
+            explanation_slot = st.container()
+        elif _collect_explanation():
+            _pending_explanation()
+        elif st.session_state.get("last_explanation"):
             with st.expander("📚 Explication par l'IA"):
                 st.write(st.session_state.last_explanation)
 
     # === Raccourcis vers l'état courant ===
-    qs = st.session_state.questions_selection
+    order = st.session_state.order
     idx = st.session_state.current_index
-    total = len(qs)
+    total = len(order)
 
     if total == 0:
         st.warning("Aucune question disponible. Vérifie la banque de questions.")
@@ -714,7 +1480,7 @@ def main():
     # === Quiz terminé ? ===
     if st.session_state.completed or idx >= total:
         st.header("🏁 Quiz terminé")
-        score = st.session_state.score
+        score = _score()
         pourcentage = score / total * 100
         st.write(f"Score final : **{score} / {total}** ({pourcentage:.1f} %)")
 
@@ -730,55 +1496,44 @@ def main():
             "Tu peux changer de cours dans la barre latérale et cliquer sur "
             "**(Re)commencer le quiz** pour recommencer."
         )
+        if st.session_state.deferred_answers:
+            _review_deferred_answers()
+        _stream_explanation(explanation_slot)
         return
 
     # === Affichage de la question courante ===
-    question = qs[idx]
+    bank_index = order[idx]
+    question = st.session_state.bank[bank_index]
     st.markdown(f"### Question {idx + 1} / {total} (cours {question['course']})")
     st.write(question["text"])
 
-    # Radio pour choisir la réponse
-    choix = st.radio(
-        "Ta réponse :",
-        options=list(range(1, len(question["choices"]) + 1)),
-        format_func=lambda i: f"{i}. {question['choices'][i - 1]}",
-        key=f"q_{idx}_answer",
-    )
-
-    # Bouton de validation
-    if st.button("Valider et question suivante ➜"):
-        bonne_reponse_index = question["answer"]
-        bonne_reponse_texte = question["choices"][bonne_reponse_index - 1]
+    # Début du temps de réponse : premier affichage de la question
+    if st.session_state.shown_index != idx:
+        st.session_state.shown_index = idx
+        st.session_state.shown_at = time.monotonic()
 
-        if choix == bonne_reponse_index:
-            st.session_state.score += 1
-            st.session_state.last_feedback = "✅ Bonne réponse !"
-            st.session_state.last_correct_answer = ""
-        else:
-            st.session_state.last_feedback = "❌ Mauvaise réponse."
-            st.session_state.last_correct_answer = (
-                f"{bonne_reponse_index}. {bonne_reponse_texte}"
-            )
+    if prefetch and st.session_state.get("prefetched_index") != idx:
+        st.session_state.prefetched_index = idx
+        _prefetch_explanations(question)
 
-        # Explication IA (Groq)
-        with st.spinner("L'IA prépare une explication..."):
-            st.session_state.last_explanation = get_ai_explanation(
-                question_text=question["text"],
-                choices=question["choices"],
-                user_index=choix,
-                correct_index=bonne_reponse_index,
-            )
-
-        # Passer à la question suivante
-        st.session_state.current_index += 1
-        if st.session_state.current_index >= total:
-            st.session_state.completed = True
-
-        st.rerun()
+    # Formulaire : choisir une réponse ne relance pas le script, seule la validation
+    # le fait, et son rappel s'exécute avant ce rerun (pas de st.rerun en plus)
+    with st.form(f"q_{idx}"):
+        st.radio(
+            "Ta réponse :",
+            options=list(range(1, len(question["choices"]) + 1)),
+            format_func=lambda i: f"{i}. {question['choices'][i - 1]}",
+            key=f"q_{idx}_answer",
+        )
+        st.form_submit_button(
+            "Valider et question suivante ➜", on_click=_submit_answer, args=(bank_index, idx)
+        )
 
     # Affichage du score provisoire
     st.progress(idx / total)
-    st.caption(f"Score provisoire : {st.session_state.score} / {total}")
+    st.caption(f"Score provisoire : {_score()} / {total}")
+
+    _stream_explanation(explanation_slot)
 
 
 if __name__ == "__main__":
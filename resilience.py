@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Maîtrise de la latence de queue des appels Groq.
+
+- `LatencyTracker` : latences récentes, pour régler le délai de la requête
+  de secours sur le p95 observé ;
+- `hedged_call` : si la première requête n'a pas répondu après ce délai,
+  une seconde identique est lancée ; la première réponse gagne, l'autre est
+  annulée : `fn` reçoit un threading.Event posé quand sa tentative a perdu,
+  à elle de fermer sa requête HTTP et de rendre sa place au plus vite ;
+- `CircuitBreaker` : après plusieurs échecs de suite, on arrête d'appeler
+  l'API pendant `reset_timeout` secondes, puis une seule requête d'essai
+  (demi-ouvert) décide de la reprise.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class DeadlineExceeded(Exception):
+    """L'appel n'a pas abouti dans le délai imparti."""
+
+
+class CircuitOpen(Exception):
+    """Le disjoncteur est ouvert : l'API n'est pas appelée."""
+
+
+class Cancelled(Exception):
+    """Tentative abandonnée par hedged_call : une autre a déjà répondu (ou le délai est passé)."""
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q, default=None):
+        """Quantile `q` (0-1) des latences récentes, ou `default` sans mesure."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return default
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    CLOSED = "fermé"
+    OPEN = "ouvert"
+    HALF_OPEN = "demi-ouvert"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = self.CLOSED
+
+    def allow(self):
+        """True si un appel peut partir (en demi-ouvert : une seule requête d'essai à la fois)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self.state = self.CLOSED
+
+    def release(self):
+        """Fin d'un appel qui ne dit rien de l'état de l'API (ex. abandonné localement)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+
+def hedged_call(executor, fn, deadline, hedge_after=None):
+    """
+    Exécute `fn(cancelled)` dans `executor` et renvoie le premier résultat obtenu.
+    Après `hedge_after` secondes sans réponse, une seconde exécution est lancée
+    (None = pas de requête de secours). Lève DeadlineExceeded après `deadline`
+    secondes, ou l'exception de la dernière tentative si toutes échouent.
+    `cancelled` (threading.Event) est posé pour chaque tentative encore en cours
+    au retour : son résultat sera ignoré, elle peut lever Cancelled.
+    """
+    end = time.monotonic() + deadline
+    cancels = {}
+
+    def submit():
+        cancelled = threading.Event()
+        future = executor.submit(fn, cancelled)
+        cancels[future] = cancelled
+        return future
+
+    futures = [submit()]
+    try:
+        if hedge_after is not None and hedge_after < deadline:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                futures.append(submit())
+        while futures:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"pas de réponse en {deadline:.0f} s")
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"pas de réponse en {deadline:.0f} s")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            futures = [f for f in futures if not f.done()]
+            if not futures:
+                raise done.pop().exception()
+    finally:
+        # Le perdant est annulé s'il n'a pas démarré, sinon prévenu qu'il a perdu
+        for future in futures:
+            if not future.cancel():
+                cancels[future].set()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Parties en cours, conservées hors de st.session_state (SQLite).
+
+Si la connexion websocket tombe ou si l'élève recharge la page, Streamlit
+crée une nouvelle session vide. L'état de la partie (ordre des questions,
+avancement, score, dernier feedback, référence de l'explication) est donc
+aussi enregistré sous un jeton de reprise, placé dans l'adresse de la page.
+
+- `load` : une seule lecture par clé primaire (ou l'état pas encore écrit) ;
+- `save` : ne fait que remplacer l'état en attente du jeton ; un thread écrit
+  toutes les `flush_interval` secondes les derniers états de tous les jetons
+  modifiés, en une transaction. Plusieurs validations rapprochées ne coûtent
+  qu'une écriture ;
+- mémoire bornée : au-delà de `max_pending` jetons en attente, les nouveaux
+  sont ignorés (l'élève reprendra un peu plus tôt) ;
+- `close()`, appelé aussi à la sortie du processus (atexit), écrit ce qui reste.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SessionStore:
+    """Jeton de reprise -> état de la partie (dict sérialisable en JSON)."""
+
+    def __init__(self, path, flush_interval=1.0, max_pending=10_000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pending = {}
+        self._writing = {}  # états en cours d'écriture, encore visibles pour load
+        self._cond = threading.Condition()
+        self._closed = False
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="sessions", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, token, state):
+        """Enregistre (en différé) l'état de la partie ; renvoie False s'il est ignoré."""
+        with self._cond:
+            if self._closed or (token not in self._pending and len(self._pending) >= self.max_pending):
+                self.dropped += 1
+                return False
+            self._pending[token] = state
+        return True
+
+    def load(self, token):
+        """Dernier état enregistré sous `token`, ou None."""
+        with self._cond:
+            state = self._pending.get(token, self._writing.get(token))
+        if state is not None:
+            return state
+        row = self._connection().execute(
+            "SELECT state FROM sessions WHERE token = ?", (token,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def expire(self, max_age):
+        """Supprime les parties non modifiées depuis `max_age` secondes ; renvoie leur nombre."""
+        return self._connection().execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,)
+        ).rowcount
+
+    def flush(self, timeout=None):
+        """Attend que les états en attente soient écrits ; renvoie False si le délai expire."""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout=10.0):
+        """Écrit les états restants et arrête le thread (idempotent)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        conn = self._connection()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, self.flush_interval)
+                batch, self._pending = self._pending, {}
+                self._writing = batch
+                if not batch and self._closed:
+                    return
+            ok = self._write(conn, batch) if batch else True
+            with self._cond:
+                self._writing = {}
+                if ok:
+                    self.written += len(batch)
+                elif self._closed:
+                    self.dropped += len(batch)
+                else:
+                    # Nouvel essai au prochain tour ; un état plus récent l'emporte
+                    for token, state in batch.items():
+                        self._pending.setdefault(token, state)
+                self._cond.notify_all()
+
+    def _write(self, conn, batch):
+        now = time.time()
+        rows = [(token, json.dumps(state, separators=(",", ":")), now) for token, state in batch.items()]
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (token, state, updated_at) VALUES (?, ?, ?)", rows
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error:
+            with self._cond:
+                self.errors += 1
+            return False
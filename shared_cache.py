@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Store d'explications partagé entre plusieurs processus / réplicas Streamlit.
+
+Deux implémentations, interchangeables sous get_ai_explanation :
+- `explanation_store.ExplanationStore` : fichier SQLite commun aux processus
+  d'une même machine (verrous de fichier de SQLite) ;
+- `RedisExplanationStore` : serveur Redis commun à toutes les machines,
+  via le protocole RESP (sans dépendance supplémentaire).
+
+Coalescence entre processus (`SingleFlightStore.get_or_compute`) : le premier
+réplica qui rate une clé prend un bail (lease) et génère l'explication ; les
+autres attendent qu'elle soit écrite, au plus `wait_timeout` secondes, puis la
+génèrent eux-mêmes. Un bail expire seul après `lease_ttl` secondes si son
+détenteur disparaît.
+"""
+import socket
+import threading
+import time
+import uuid
+from urllib.parse import unquote, urlparse
+
+
+class SingleFlightStore:
+    """
+    Coalescence entre processus, à partir des primitives du store :
+    get, put, acquire_lease, release_lease, leased.
+    """
+
+    lease_ttl = 30.0
+    wait_timeout = 20.0
+    poll_interval = 0.2
+
+    def wait_for(self, key, timeout):
+        """
+        Attend que la clé soit écrite par le détenteur de son bail. Renvoie None
+        si le délai est dépassé ou si le bail est libéré sans résultat.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline or not self.leased(key):
+                return None
+            time.sleep(self.poll_interval)
+
+    def get_or_compute(self, key, question_id, compute, lease=True):
+        """
+        Renvoie la valeur stockée, sinon `compute()` appelée par un seul réplica
+        à la fois ; les autres attendent son résultat (borné par wait_timeout).
+        Avec lease=False (calcul de fond), aucun bail n'est pris : un demandeur
+        interactif n'attend jamais un calcul moins prioritaire.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        token = None
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            if not lease:
+                # Attend seulement un bail déjà pris (wait_for revient aussitôt sinon)
+                return self.wait_for(key, self.wait_timeout) or self._compute(key, question_id, compute)
+            token = self.acquire_lease(key)
+            if token is not None:
+                break
+            value = self.wait_for(key, deadline - time.monotonic())
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                # Le détenteur du bail tarde trop : on génère sans attendre davantage
+                break
+
+        try:
+            # Écrite entre notre lecture et la prise du bail ?
+            value = self.get(key) if token is not None else None
+            return value if value is not None else self._compute(key, question_id, compute)
+        finally:
+            if token is not None:
+                self.release_lease(key, token)
+
+    def _compute(self, key, question_id, compute):
+        value = compute()
+        if value:
+            self.put(key, question_id, value)
+        return value
+
+
+class RedisError(Exception):
+    """Erreur renvoyée par le serveur Redis."""
+
+
+class _RespConnection:
+    def __init__(self, host, port, db=0, password=None, timeout=1.0, connect_timeout=0.5):
+        self._sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self._sock.settimeout(timeout)
+        self._file = self._sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connexion Redis interrompue")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else self._file.read(size + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise RedisError(f"réponse inattendue : {line!r}")
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class RedisExplanationStore(SingleFlightStore):
+    """
+    Store clé -> explication dans Redis (url : redis://[:mot_de_passe@]hôte[:port][/base]).
+    Les entrées expirent au bout de `ttl` secondes (pas d'éviction par la taille :
+    c'est la politique maxmemory du serveur qui s'en charge). Si le serveur est
+    injoignable ou ne répond pas (délais `connect_timeout` et `timeout`, en s),
+    le store se comporte comme vide et l'application appelle Groq ; il ne tente
+    plus de se reconnecter pendant `retry_interval` secondes, pour qu'une panne
+    de Redis ne coûte pas un délai de connexion à chaque lecture.
+    """
+
+    def __init__(
+        self,
+        url,
+        ttl=7 * 24 * 3600,
+        prefix="quizz:",
+        lease_ttl=None,
+        wait_timeout=None,
+        timeout=1.0,
+        connect_timeout=0.5,
+        retry_interval=30.0,
+    ):
+        parsed = urlparse(url)
+        self._address = (
+            parsed.hostname or "localhost",
+            parsed.port or 6379,
+            int(parsed.path.lstrip("/") or 0),
+            unquote(parsed.password) if parsed.password else None,
+        )
+        self.ttl = ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retry_interval = retry_interval
+        self._down_until = 0.0  # pas de nouvelle connexion avant (time.monotonic)
+        if lease_ttl is not None:
+            self.lease_ttl = lease_ttl
+        if wait_timeout is not None:
+            self.wait_timeout = wait_timeout
+        self._local = threading.local()
+
+    def _command(self, *args):
+        conn = getattr(self._local, "conn", None)
+        while True:
+            reused = conn is not None
+            if not reused:
+                conn = self._local.conn = _RespConnection(
+                    *self._address, timeout=self.timeout, connect_timeout=self.connect_timeout
+                )
+            try:
+                return conn.command(*args)
+            except (OSError, ConnectionError) as exc:
+                conn.close()
+                conn = self._local.conn = None
+                # Seule une connexion gardée d'un appel précédent (serveur redémarré
+                # depuis) mérite un nouvel essai ; pas un serveur qui ne répond plus
+                if not reused or isinstance(exc, TimeoutError):
+                    raise
+
+    def _safe(self, default, *args):
+        if time.monotonic() < self._down_until:
+            return default
+        try:
+            return self._command(*args)
+        except (OSError, ConnectionError):
+            self._down_until = time.monotonic() + self.retry_interval
+            return default
+
+    def _key(self, key):
+        return f"{self.prefix}explication:{key}"
+
+    def _lease_key(self, key):
+        return f"{self.prefix}bail:{key}"
+
+    def get(self, key):
+        return self._safe(None, "GET", self._key(key))
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            values = self._safe(None, "MGET", *(self._key(k) for k in chunk)) or []
+            found.update((k, v) for k, v in zip(chunk, values) if v is not None)
+        return found
+
+    def put(self, key, question_id, explanation):
+        self._safe(None, "SET", self._key(key), explanation, "EX", int(self.ttl))
+
+    def acquire_lease(self, key):
+        """Jeton du bail pris sur `key`, ou None si un autre réplica le détient."""
+        token = uuid.uuid4().hex
+        reply = self._safe(
+            "OK", "SET", self._lease_key(key), token, "NX", "PX", int(self.lease_ttl * 1000)
+        )
+        # Serveur injoignable (_safe -> "OK") : chacun génère de son côté
+        return token if reply == "OK" else None
+
+    def release_lease(self, key, token):
+        # Sans script Lua : un bail expiré puis repris entre GET et DEL serait
+        # libéré à tort, au pire une génération en double
+        if self._safe(None, "GET", self._lease_key(key)) == token:
+            self._safe(None, "DEL", self._lease_key(key))
+
+    def leased(self, key):
+        return bool(self._safe(0, "EXISTS", self._lease_key(key)))
+
+    def invalidate(self, question_id):
+        """Sans index par question : les explications obsolètes expirent avec leur TTL."""
+
+    def prune(self, valid_question_ids):
+        """Sans index par question : les explications obsolètes expirent avec leur TTL."""
+        return 0
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Index de similarité des questions (TF-IDF sur n-grammes de caractères, NumPy).
+
+Sert à retrouver, avant tout appel à Groq, une question quasi identique déjà
+expliquée : reformulation légère, même question reprise dans un autre cours.
+Au-delà d'un seuil élevé son explication est réutilisée telle quelle ; un peu
+en dessous, elle est seulement donnée au modèle comme contexte.
+
+Le texte indexé d'une question est son énoncé normalisé suivi de ses choix
+triés (l'ordre des choix ne compte pas). Les vecteurs (tf sous-linéaire x idf,
+normés) sont stockés deux fois :
+- par n-gramme (listes inversées) pour trouver vite les candidates, en
+  parcourant les n-grammes de la requête du plus rare au plus courant, dans
+  la limite de `max_postings` entrées : deux quasi-doublons partagent leurs
+  n-grammes rares ; les n-grammes présents dans plus de `max_df` des questions
+  en sont exclus, ils coûtent cher et pèsent peu ;
+- par question, pour recalculer le cosinus exact des quelques candidates.
+
+L'index est reconstruit d'un bloc (`rebuild`) quand la banque change ; avec
+`refresh`, la reconstruction se fait en tâche de fond et les requêtes
+continuent entre-temps sur l'ancienne version.
+"""
+import math
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+from question_identity import normalize_text, question_id
+
+
+class Match(NamedTuple):
+    question: dict
+    score: float
+
+
+class _IndexState(NamedTuple):
+    questions: list
+    vocab: dict
+    idf: np.ndarray
+    unknown_idf: float
+    col_starts: np.ndarray  # listes inversées : n-gramme -> questions
+    col_docs: np.ndarray
+    col_weights: np.ndarray
+    row_starts: np.ndarray  # vecteurs par question
+    row_cols: np.ndarray
+    row_weights: np.ndarray
+
+
+def document_text(question_text, choices):
+    return " | ".join([normalize_text(question_text), *sorted(normalize_text(c) for c in choices)])
+
+
+def _ngrams(text, n):
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+class SimilarityIndex:
+    def __init__(self, ngram=3, max_df=0.5, max_postings=2048, shortlist=20):
+        self.ngram = ngram
+        self.max_df = max_df
+        self.max_postings = max_postings
+        self.shortlist = shortlist
+        self._lock = threading.Lock()
+        self._state = None
+        self._rebuilding = None
+        self.version = None
+
+    def __len__(self):
+        state = self._state
+        return 0 if state is None else len(state.questions)
+
+    def refresh(self, questions, version):
+        """
+        Reconstruit l'index si `version` a changé : tout de suite s'il est vide,
+        sinon dans un thread (une seule reconstruction à la fois).
+        """
+        with self._lock:
+            if version == self.version or version == self._rebuilding:
+                return
+            if self._state is not None:
+                self._rebuilding = version
+                threading.Thread(
+                    target=self.rebuild, args=(questions, version), name="index-similarite", daemon=True
+                ).start()
+                return
+        self.rebuild(questions, version)
+
+    def rebuild(self, questions, version=None):
+        """Reconstruit l'index sur des dicts {"text", "choices", ...} (doublons exacts fusionnés)."""
+        unique, seen = [], set()
+        for q in questions:
+            qid = question_id(q["text"], q["choices"])
+            if qid not in seen:
+                seen.add(qid)
+                unique.append(q)
+
+        vocab, rows, cols, counts = {}, [], [], []
+        for row, q in enumerate(unique):
+            for gram, count in _ngrams(document_text(q["text"], q["choices"]), self.ngram).items():
+                rows.append(row)
+                cols.append(vocab.setdefault(gram, len(vocab)))
+                counts.append(count)
+        n_docs, n_terms = len(unique), len(vocab)
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+
+        df = np.bincount(cols, minlength=n_terms)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        weights = (1 + np.log(np.asarray(counts, dtype=np.float32))) * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_docs))
+        weights /= norms[rows].astype(np.float32)
+
+        # (rows, cols) sont déjà groupés par question
+        row_starts = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_docs), out=row_starts[1:])
+
+        keep = df[cols] <= max(1, self.max_df * n_docs)
+        order = np.argsort(cols[keep], kind="stable")
+        col_starts = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols[keep], minlength=n_terms), out=col_starts[1:])
+
+        state = _IndexState(
+            questions=unique,
+            vocab=vocab,
+            idf=idf,
+            unknown_idf=math.log(1 + n_docs) + 1,
+            col_starts=col_starts,
+            col_docs=rows[keep][order],
+            col_weights=weights[keep][order],
+            row_starts=row_starts,
+            row_cols=cols,
+            row_weights=weights,
+        )
+        with self._lock:
+            self._state = state
+            self.version = version
+            if self._rebuilding == version:
+                self._rebuilding = None
+
+    def query(self, question_text, choices, threshold=0.0, k=5):
+        """Jusqu'à `k` questions de l'index de similarité cosinus >= `threshold`, la plus proche d'abord."""
+        state = self._state
+        if state is None or not state.questions:
+            return []
+
+        cols, tf, unknown = [], [], 0.0
+        for gram, count in _ngrams(document_text(question_text, choices), self.ngram).items():
+            col = state.vocab.get(gram)
+            if col is None:
+                # Absent de l'index : ne compte que dans la norme de la requête
+                unknown += ((1 + math.log(count)) * state.unknown_idf) ** 2
+            else:
+                cols.append(col)
+                tf.append(count)
+        if not cols:
+            return []
+        cols = np.asarray(cols, dtype=np.int64)
+        weights = (1 + np.log(np.asarray(tf, dtype=np.float32))) * state.idf[cols]
+        weights /= math.sqrt(float(weights @ weights) + unknown)
+
+        # Candidates : score partiel sur les n-grammes les plus rares
+        starts = state.col_starts[cols]
+        lengths = state.col_starts[cols + 1] - starts
+        order = np.argsort(lengths, kind="stable")
+        used = max(1, int(np.searchsorted(np.cumsum(lengths[order]), self.max_postings, side="right")))
+        starts, lengths = starts[order[:used]], lengths[order[:used]]
+        total = int(lengths.sum())
+        if total == 0:
+            return []
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        partial = np.bincount(
+            state.col_docs[offsets],
+            weights=state.col_weights[offsets] * np.repeat(weights[order[:used]], lengths),
+            minlength=len(state.questions),
+        )
+        n_candidates = min(self.shortlist, len(partial))
+        candidates = np.argpartition(-partial, n_candidates - 1)[:n_candidates]
+        candidates = candidates[partial[candidates] > 0]
+
+        if not len(candidates):
+            return []
+
+        # Cosinus exact des candidates
+        dense = np.zeros(len(state.vocab), dtype=np.float32)
+        dense[cols] = weights
+        starts = state.row_starts[candidates]
+        lengths = state.row_starts[candidates + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        products = dense[state.row_cols[offsets]] * state.row_weights[offsets]
+        scores = np.add.reduceat(products, np.cumsum(lengths) - lengths)
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [
+            Match(state.questions[candidates[i]], min(float(scores[i]), 1.0))
+            for i in best
+            if scores[i] >= threshold
+        ]
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Révision espacée (boîtes de Leitner) : chaque élève revoit surtout les
+questions qu'il ne maîtrise pas encore, au lieu de refaire celles qu'il sait.
+
+- une bonne réponse fait monter la question d'une boîte, une erreur la
+  renvoie en boîte 0 ; la question revient INTERVALS[boîte] secondes plus tard ;
+- `LeitnerSchedule` choisit la question suivante : tas (heapq) ordonné par
+  échéance puis par difficulté (la plus ratée d'abord), puis au hasard : deux
+  élèves sans historique ne voient pas la banque dans l'ordre du fichier.
+  O(log n) par question même sur des dizaines de milliers de questions. Les
+  questions jamais vues sont dues dès le début de la partie ;
+- `LearnerStore` conserve l'état de chaque élève (boîte et échéance par
+  question) dans SQLite, d'une partie et d'une session à l'autre.
+
+Une entrée du tas est un seul entier (échéance, difficulté, tirage, position) :
+l'ordre des entiers est celui des triplets, et l'état de la session reste compact.
+"""
+import heapq
+import os
+import random
+import sqlite3
+import threading
+from typing import NamedTuple
+
+# Délai (s) avant de revoir une question, selon sa boîte
+INTERVALS = (60, 10 * 60, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600, 16 * 24 * 3600, 35 * 24 * 3600)
+
+_POSITION_BITS = 32
+_SHUFFLE_BITS = 20
+_DIFFICULTY_BITS = 8
+_POSITION_MASK = (1 << _POSITION_BITS) - 1
+_DIFFICULTY_MAX = (1 << _DIFFICULTY_BITS) - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    learner TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    box INTEGER NOT NULL,
+    due INTEGER NOT NULL,
+    PRIMARY KEY (learner, question_id)
+) WITHOUT ROWID;
+"""
+
+
+class ReviewState(NamedTuple):
+    box: int
+    due: int  # échéance, en secondes depuis l'epoch
+
+
+def next_review(state, correct, now, intervals=INTERVALS):
+    """État d'une question après une réponse (state vaut None si elle n'avait jamais été vue)."""
+    if not correct:
+        box = 0
+    elif state is None:
+        box = 1
+    else:
+        box = min(state.box + 1, len(intervals) - 1)
+    return ReviewState(box, int(now) + intervals[box])
+
+
+class LeitnerSchedule:
+    """Ordre de passage des questions `positions` pour un élève."""
+
+    def __init__(self, positions, states, difficulty, now, rng=None):
+        """
+        `states` : {position: ReviewState} des questions déjà vues par l'élève ;
+        `difficulty` : taux d'erreur (0-1) indexé par position dans la banque ;
+        `rng` : départage des ex æquo (random.Random, pour des tests reproductibles).
+        """
+        self._rng = rng or random.Random()
+        self._difficulty = {}  # position -> difficulté, pour les questions sorties du tas
+        heap = []
+        for position in positions:
+            state = states.get(position)
+            due = int(now) if state is None else state.due
+            heap.append(self._entry(due, self._quantize(difficulty[position]), position))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def __len__(self):
+        return len(self._heap) + len(self._difficulty)
+
+    @staticmethod
+    def _quantize(difficulty):
+        return round(min(max(float(difficulty), 0.0), 1.0) * _DIFFICULTY_MAX)
+
+    def _entry(self, due, difficulty, position):
+        # Difficulté inversée : à échéance égale, la plus ratée sort la première ;
+        # à difficulté égale, un tirage aléatoire plutôt que l'ordre de la banque
+        return (
+            max(due, 0) << (_DIFFICULTY_BITS + _SHUFFLE_BITS + _POSITION_BITS)
+            | (_DIFFICULTY_MAX - difficulty) << (_SHUFFLE_BITS + _POSITION_BITS)
+            | self._rng.getrandbits(_SHUFFLE_BITS) << _POSITION_BITS
+            | position
+        )
+
+    @staticmethod
+    def _difficulty_of(entry):
+        return _DIFFICULTY_MAX - (entry >> (_SHUFFLE_BITS + _POSITION_BITS) & _DIFFICULTY_MAX)
+
+    def due(self):
+        """Échéance de la prochaine question, ou None s'il n'y en a plus."""
+        return self._heap[0] >> (_DIFFICULTY_BITS + _SHUFFLE_BITS + _POSITION_BITS) if self._heap else None
+
+    def pop(self):
+        """Position de la prochaine question (celle dont l'échéance est la plus proche)."""
+        entry = heapq.heappop(self._heap)
+        position = entry & _POSITION_MASK
+        self._difficulty[position] = self._difficulty_of(entry)
+        return position
+
+    def take(self, position):
+        """Sort du tas une question précise, comme pop (O(n) : reprise d'une partie seulement)."""
+        for i, entry in enumerate(self._heap):
+            if entry & _POSITION_MASK == position:
+                self._heap[i] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._difficulty[position] = self._difficulty_of(entry)
+                return True
+        return False
+
+    def reschedule(self, position, due):
+        """Remet dans le tas une question sortie par pop, pour l'échéance `due`."""
+        difficulty = self._difficulty.pop(position)
+        heapq.heappush(self._heap, self._entry(int(due), difficulty, position))
+
+
+class LearnerStore:
+    """Boîte et échéance de chaque question, par élève (SQLite, une connexion par thread)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, learner):
+        """{identifiant de question: ReviewState} des questions déjà vues par l'élève."""
+        rows = self._connection().execute(
+            "SELECT question_id, box, due FROM reviews WHERE learner = ?", (learner,)
+        )
+        return {qid: ReviewState(box, due) for qid, box, due in rows}
+
+    def load_one(self, learner, question_id):
+        """ReviewState d'une question pour l'élève, ou None s'il ne l'a jamais vue."""
+        row = self._connection().execute(
+            "SELECT box, due FROM reviews WHERE learner = ? AND question_id = ?", (learner, question_id)
+        ).fetchone()
+        return ReviewState(*row) if row else None
+
+    def save(self, learner, question_id, state):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO reviews (learner, question_id, box, due) VALUES (?, ?, ?, ?)",
+            (learner, question_id, state.box, state.due),
+        )
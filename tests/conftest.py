@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Les modules de l'application sont à la racine du dépôt, sans paquet."""
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quizzCompoRFavecIA as app  # noqa: E402
+from groq_scheduler import GroqScheduler  # noqa: E402
+from resilience import CircuitBreaker  # noqa: E402
+
+
+class _SlowClient:
+    """Client Groq en streaming qui met `delay` secondes à répondre, `final` en dernier événement."""
+
+    def __init__(self, delay, output_text, final):
+        self.delay = delay
+        self.output_text = output_text
+        self.final = final
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def with_options(self, **kwargs):
+        return self
+
+    @property
+    def responses(self):
+        return self
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        response = types.SimpleNamespace(output_text=self.output_text, usage=None)
+
+        def events():
+            yield types.SimpleNamespace(type="response.created")
+            time.sleep(self.delay)
+            yield types.SimpleNamespace(type="response.output_text.delta", delta=self.output_text)
+            if self.final is not None:
+                yield types.SimpleNamespace(type=self.final, response=response)
+
+        return _Stream(events())
+
+
+class _Stream:
+    def __init__(self, events):
+        self._events = events
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    """Installe un faux client Groq lent (et un ordonnanceur, un disjoncteur neufs)."""
+
+    def install(delay, output_text, final="response.completed"):
+        client = _SlowClient(delay, output_text, final)
+        monkeypatch.setattr(app, "_groq_client", lambda: client)
+        return client
+
+    monkeypatch.setattr(app, "_scheduler", lambda: GroqScheduler())
+    monkeypatch.setattr(app, "_circuit_breaker", lambda: CircuitBreaker())
+    monkeypatch.setattr(app, "GROQ_HEDGE_MIN_DELAY", 0.1)
+    monkeypatch.setattr(app, "GROQ_HEDGE_MAX_DELAY", 0.1)
+    return install
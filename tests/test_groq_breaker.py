@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Disjoncteur et ordonnanceur autour des appels Groq : une saturation locale
+(file pleine, délai passé dans la file) ne doit ni ouvrir le disjoncteur ni
+bloquer sa requête d'essai.
+"""
+import time
+
+import pytest
+
+import quizzCompoRFavecIA as app
+from groq_scheduler import GroqScheduler, Overloaded
+from resilience import CircuitBreaker, DeadlineExceeded
+
+
+class _SlowQueue:
+    """Ordonnanceur dont la file ne libère jamais de place à temps."""
+
+    def call(self, fn, priority=None, tokens=1, max_wait=None):
+        time.sleep(max_wait + 0.2)
+        raise Overloaded("attente trop longue pour Groq")
+
+
+class _HangingClient:
+    """Client Groq qui ne répond pas avant le délai."""
+
+    def with_options(self, **kwargs):
+        return self
+
+    @property
+    def responses(self):
+        return self
+
+    def create(self, **kwargs):
+        time.sleep(0.5)
+        raise AssertionError("le délai aurait dû expirer avant")
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    monkeypatch.setattr(app, "_circuit_breaker", lambda: breaker)
+    monkeypatch.setattr(app, "GROQ_DEADLINE", 0.2)
+    return breaker
+
+
+def _half_open(breaker):
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    time.sleep(0.06)
+
+
+def _route():
+    return app._model_router().routes["standard"]
+
+
+def test_stream_overloaded_releases_half_open_probe(breaker, monkeypatch):
+    monkeypatch.setattr(app, "_scheduler", lambda: GroqScheduler(max_queue=0))
+    _half_open(breaker)
+
+    with pytest.raises(Overloaded):
+        list(app._stream_groq("Question ?", ["Vrai", "Faux"], 1, 2))
+
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.allow()  # la requête d'essai suivante peut partir
+
+
+def test_create_response_overloaded_releases_half_open_probe(breaker, monkeypatch):
+    monkeypatch.setattr(app, "_scheduler", lambda: GroqScheduler(max_queue=0))
+    _half_open(breaker)
+
+    with pytest.raises(Overloaded):
+        app._create_response("prompt", _route())
+
+    assert breaker.allow()
+
+
+def test_deadline_spent_in_local_queue_is_not_a_groq_failure(breaker, monkeypatch):
+    monkeypatch.setattr(app, "_scheduler", lambda: _SlowQueue())
+
+    with pytest.raises(DeadlineExceeded):
+        app._create_response("prompt", _route())
+
+    assert breaker.state == breaker.CLOSED
+
+
+def test_deadline_after_reaching_groq_is_a_failure(breaker, monkeypatch):
+    monkeypatch.setattr(app, "_scheduler", lambda: GroqScheduler())
+    monkeypatch.setattr(app, "_groq_client", lambda: _HangingClient())
+
+    with pytest.raises(DeadlineExceeded):
+        app._create_response("prompt", _route())
+
+    assert breaker.state == breaker.OPEN
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Requête de secours (hedging) : seulement pour les explications unitaires,
+jamais pour les appels groupés, les plus chers.
+"""
+import pytest
+
+import quizzCompoRFavecIA as app
+
+
+def test_single_explanation_is_hedged(groq):
+    client = groq(0.3, "Explication.")
+    assert app._ask_groq("Question ?", ["A", "B", "C"], 1, 2) == "Explication."
+    assert client.calls == 2
+
+
+def test_batch_is_not_hedged(groq):
+    client = groq(0.3, '{"1": "Un.", "2": "Deux."}')
+    items = [
+        {"question_text": "Question ?", "choices": ["A", "B", "C"], "user_index": i, "correct_index": 2}
+        for i in (1, 3)
+    ]
+    assert app._ask_groq_batch(items) == ["Un.", "Deux."]
+    assert client.calls == 1
+
+
+def test_all_choices_request_is_not_hedged(groq):
+    client = groq(0.3, "{}")
+    with pytest.raises(ValueError):
+        app._ask_groq_all_choices("Question ?", ["A", "B", "C"], 2)
+    assert client.calls == 1
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Réponse tronquée (response.incomplete : max_output_tokens atteint) ou flux
+coupé avant response.completed : l'élève reçoit un repli, rien n'est mis en cache.
+"""
+import pytest
+
+import quizzCompoRFavecIA as app
+from explanation_cache import ExplanationCache, make_key
+from explanation_store import ExplanationStore
+
+QUESTION = ("Question ?", ["A", "B", "C"], 1, 2)
+
+
+@pytest.fixture
+def caches(monkeypatch, tmp_path):
+    cache = ExplanationCache()
+    store = ExplanationStore(str(tmp_path / "explications.sqlite3"))
+    monkeypatch.setattr(app, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(app, "_explanation_cache", lambda: cache)
+    monkeypatch.setattr(app, "_explanation_store", lambda: store)
+    monkeypatch.setattr(app, "_similar_explanation", lambda *args: (None, None))
+    return cache, store
+
+
+def test_truncated_response_is_rejected(groq):
+    groq(0.0, "Explication coupée au mil", final="response.incomplete")
+    with pytest.raises(app.EmptyCompletion):
+        app._ask_groq(*QUESTION)
+
+
+@pytest.mark.parametrize("final", ["response.incomplete", None])
+def test_truncated_stream_is_rejected(groq, final):
+    groq(0.0, "Explication coupée au mil", final=final)
+    stream = app._stream_groq(*QUESTION)
+    assert next(stream) == "Explication coupée au mil"
+    with pytest.raises(app.EmptyCompletion):
+        next(stream)
+
+
+def test_truncated_explanation_is_not_cached(groq, caches):
+    cache, store = caches
+    groq(0.0, "Explication coupée au mil", final="response.incomplete")
+    key = make_key(*QUESTION)
+
+    assert app.get_ai_explanation(*QUESTION) == app.BUSY_MESSAGE
+    assert "".join(app.stream_ai_explanation(*QUESTION)).endswith(app.BUSY_MESSAGE)
+    assert cache.get(key) is None and store.get(key) is None
+
+
+def test_complete_explanation_is_cached(groq, caches):
+    cache, store = caches
+    groq(0.0, "Explication complète.")
+    key = make_key(*QUESTION)
+
+    assert "".join(app.stream_ai_explanation(*QUESTION)) == "Explication complète."
+    assert cache.get(key) == store.get(key) == "Explication complète."
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Routage des modèles : seules les explications unitaires comptent dans le p95
+d'un modèle ; un lot de fin de quiz, long par nature, ne doit pas faire
+basculer tout le trafic vers le petit modèle.
+"""
+import pytest
+
+import quizzCompoRFavecIA as app
+from model_router import ModelRouter, question_features
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter(app.GROQ_ROUTES, latency_slo=0.2)
+    monkeypatch.setattr(app, "_model_router", lambda: router)
+    return router
+
+
+def _wrong_answer_route(router):
+    choices = ["A", "B", "C", "D"]
+    return router.choose(question_features(choices, 1, 2, app._build_prompt("Question ?", choices, 1, 2)))
+
+
+def test_batch_latency_does_not_reroute(groq, router):
+    groq(0.3, '{"1": "Un.", "2": "Deux."}')
+    items = [
+        {"question_text": "Question ?", "choices": ["A", "B", "C"], "user_index": i, "correct_index": 2}
+        for i in (1, 3)
+    ]
+    app._ask_groq_batch(items)
+
+    assert router.p95(router.routes["standard"].model) is None
+    assert _wrong_answer_route(router).name == "standard"
+
+
+def test_slow_single_explanations_reroute(groq, router):
+    groq(0.3, "Explication.")
+    app._ask_groq("Question ?", ["A", "B", "C", "D"], 1, 2)
+
+    assert router.p95(router.routes["standard"].model) >= 0.3
+    assert _wrong_answer_route(router).name == "rapide"
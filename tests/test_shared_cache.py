@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+RedisExplanationStore contre un petit serveur RESP en mémoire (dans le
+processus) : baux, attente du détenteur, MGET par paquets, serveur injoignable
+ou muet.
+"""
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from shared_cache import RedisExplanationStore
+
+
+class _FakeRedis(socketserver.ThreadingTCPServer):
+    """Sous-ensemble de Redis utilisé par le store : GET, MGET, SET (EX/PX/NX), DEL, EXISTS."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, _Handler)
+        self.lock = threading.Lock()
+        self.data = {}  # clé -> (valeur, échéance ou None)
+        self.commands = []
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+            with self.server.lock:
+                self.server.commands.append(args)
+                reply = self._execute(args[0].upper(), args[1:])
+            self.wfile.write(reply)
+
+    def _execute(self, name, args):
+        server = self.server
+        if name == "GET":
+            return _bulk(server.get(args[0]))
+        if name == "MGET":
+            return b"*%d\r\n" % len(args) + b"".join(_bulk(server.get(k)) for k in args)
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if "NX" in options and server.get(key) is not None:
+                return b"$-1\r\n"
+            expires_at = None
+            if "EX" in options:
+                expires_at = time.monotonic() + int(options[options.index("EX") + 1])
+            if "PX" in options:
+                expires_at = time.monotonic() + int(options[options.index("PX") + 1]) / 1000
+            server.data[key] = (value, expires_at)
+            return b"+OK\r\n"
+        if name == "DEL":
+            return b":%d\r\n" % sum(server.data.pop(k, None) is not None for k in args)
+        if name == "EXISTS":
+            return b":%d\r\n" % sum(server.get(k) is not None for k in args)
+        return b"-ERR commande inconnue\r\n"
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+@pytest.fixture
+def redis_url():
+    server = _FakeRedis()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, "redis://127.0.0.1:%d/0" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_lease_is_exclusive_and_released(redis_url):
+    _, url = redis_url
+    first = RedisExplanationStore(url)
+    second = RedisExplanationStore(url)
+
+    token = first.acquire_lease("k")
+    assert token is not None
+    assert second.acquire_lease("k") is None
+    assert second.leased("k")
+
+    second.release_lease("k", "pas-le-bon-jeton")
+    assert second.leased("k")
+
+    first.release_lease("k", token)
+    assert not second.leased("k")
+    assert second.acquire_lease("k") is not None
+
+
+def test_waiter_gets_the_lease_holder_value(redis_url):
+    _, url = redis_url
+    holder = RedisExplanationStore(url)
+    waiter = RedisExplanationStore(url, wait_timeout=5)
+    waiter.poll_interval = 0.01
+    token = holder.acquire_lease("k")
+
+    def finish():
+        time.sleep(0.1)
+        holder.put("k", "q", "explication")
+        holder.release_lease("k", token)
+
+    threading.Thread(target=finish).start()
+    computed = []
+    assert waiter.get_or_compute("k", "q", lambda: computed.append(1) or "doublon") == "explication"
+    assert computed == []
+
+
+def test_waiter_computes_after_timeout(redis_url):
+    _, url = redis_url
+    holder = RedisExplanationStore(url)
+    waiter = RedisExplanationStore(url, wait_timeout=0.2)
+    waiter.poll_interval = 0.01
+    assert holder.acquire_lease("k") is not None
+
+    start = time.monotonic()
+    assert waiter.get_or_compute("k", "q", lambda: "moi") == "moi"
+    assert time.monotonic() - start >= 0.2
+    assert waiter.get("k") == "moi"
+
+
+def test_concurrent_misses_compute_once(redis_url):
+    _, url = redis_url
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "explication"
+
+    def worker(results):
+        store = RedisExplanationStore(url)
+        store.poll_interval = 0.01
+        results.append(store.get_or_compute("k", "q", compute))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["explication"] * 5
+    assert len(calls) == 1
+
+
+def test_get_many_is_chunked(redis_url):
+    server, url = redis_url
+    store = RedisExplanationStore(url)
+    keys = [f"k{i}" for i in range(1201)]
+    for key in keys[::100]:
+        store.put(key, "q", f"explication {key}")
+
+    server.commands.clear()
+    found = store.get_many(keys + ["absente"])
+
+    assert found == {key: f"explication {key}" for key in keys[::100]}
+    assert [len(args) - 1 for args in server.commands if args[0] == "MGET"] == [500, 500, 202]
+
+
+def test_unreachable_server_behaves_as_empty_store():
+    # Port libre : rien n'y écoute
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    store = RedisExplanationStore(f"redis://127.0.0.1:{port}/0", wait_timeout=0.2)
+
+    assert store.get("k") is None
+    assert store.get_many(["a", "b"]) == {}
+    store.put("k", "q", "explication")
+    assert store.acquire_lease("k") is not None
+    assert not store.leased("k")
+    assert store.get_or_compute("k", "q", lambda: "locale") == "locale"
+
+
+def test_silent_server_is_skipped_after_first_timeout():
+    # Connexion acceptée par le noyau, mais aucune réponse (hôte surchargé, pare-feu...)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(16)
+        store = RedisExplanationStore(
+            "redis://127.0.0.1:%d/0" % sock.getsockname()[1], timeout=0.2, wait_timeout=5
+        )
+
+        start = time.monotonic()
+        assert store.get("k") is None
+        assert time.monotonic() - start < 0.5  # un seul délai, pas de nouvel essai
+
+        # Un clic « Valider » : lecture, bail, écriture... sans autre délai
+        start = time.monotonic()
+        assert store.get_or_compute("k", "q", lambda: "locale") == "locale"
+        assert store.get_many(["a", "b"]) == {}
+        store.release_lease("k", "jeton")
+        assert time.monotonic() - start < 0.1
+
+
+def test_store_reconnects_after_retry_interval(redis_url):
+    server, url = redis_url
+    RedisExplanationStore(url).put("k", "q", "explication")
+    server.shutdown()
+    server.server_close()
+
+    store = RedisExplanationStore(url, retry_interval=0.2)
+    assert store.get("k") is None  # serveur arrêté : le store est marqué hors service
+
+    restarted = _FakeRedis(server.server_address)
+    restarted.data = server.data
+    threading.Thread(target=restarted.serve_forever, daemon=True).start()
+    try:
+        assert store.get("k") is None
+        assert restarted.commands == []  # pas de reconnexion avant retry_interval
+        time.sleep(0.25)
+        assert store.get("k") == "explication"
+    finally:
+        restarted.shutdown()
+        restarted.server_close()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Comptage des tokens consommés par les appels Groq.
+
+Pour chaque modèle : nombre d'appels, tokens d'entrée (dont ceux servis par le
+cache de préfixe du fournisseur), tokens de sortie, et délai avant le premier
+token des réponses en streaming. Permet de vérifier l'effet de la mise en page
+des prompts (préfixe statique commun + suffixe variable compact).
+"""
+import threading
+from collections import Counter, defaultdict
+
+from resilience import LatencyTracker
+
+
+def usage_tokens(usage):
+    """(entrée, entrée en cache, sortie) d'un objet `usage` de l'API Responses."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "input_tokens_details", None)
+    return (
+        getattr(usage, "input_tokens", 0) or 0,
+        getattr(details, "cached_tokens", 0) or 0,
+        getattr(usage, "output_tokens", 0) or 0,
+    )
+
+
+class UsageMeter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(Counter)
+        self._first_token = defaultdict(LatencyTracker)
+
+    def record(self, model, usage):
+        """Ajoute la consommation d'un appel ; renvoie son total de tokens (entrée + sortie)."""
+        input_tokens, cached_tokens, output_tokens = usage_tokens(usage)
+        with self._lock:
+            totals = self._totals[model]
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["cached_input_tokens"] += cached_tokens
+            totals["output_tokens"] += output_tokens
+        return input_tokens + output_tokens
+
+    def record_first_token(self, model, seconds):
+        with self._lock:
+            tracker = self._first_token[model]
+        tracker.record(seconds)
+
+    def snapshot(self):
+        """{modèle: statistiques} avec moyennes par appel et TTFT médian / p95 (s)."""
+        with self._lock:
+            totals = {model: dict(counter) for model, counter in self._totals.items()}
+            trackers = dict(self._first_token)
+        report = {}
+        for model in set(totals) | set(trackers):
+            stats = totals.get(model, {})
+            calls = stats.get("calls", 0)
+            if calls:
+                stats["avg_input_tokens"] = stats["input_tokens"] / calls
+                stats["avg_output_tokens"] = stats["output_tokens"] / calls
+            tracker = trackers.get(model)
+            if tracker is not None:
+                stats["ttft_p50"] = tracker.percentile(0.5)
+                stats["ttft_p95"] = tracker.percentile(0.95)
+            report[model] = stats
+        return report